@@ -0,0 +1,172 @@
+"""
+Asyncio fetch engine shared by the list-page spiders.
+
+A spider supplies a coroutine ``fetch_one(session, item)`` that downloads and
+parses one page; :func:`crawl` runs it for every item with at most
+``concurrency`` requests in flight and returns the results in input order.
+
+When several spiders run in one process (see ``runner``),
+:func:`start_shared_loop` starts a single event loop in a background thread;
+``crawl`` calls from any thread are then scheduled on it and share one
+``aiohttp`` connection pool.
+"""
+import asyncio
+import threading
+import time
+
+import aiohttp
+from requests.structures import CaseInsensitiveDict
+from tqdm import tqdm
+
+import http_cache
+import http_client
+import ratelimit
+
+# 请求失败时 fetch_one 需要捕获的异常
+FETCH_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+# 共享事件循环上所有爬虫合计的最大连接数
+SHARED_CONNECTIONS = 100
+
+_shared_loop = None
+_shared_thread = None
+_shared_session = None
+
+
+async def fetch_bytes(session, url, headers=None, timeout=10, cache=False):
+    """
+    GET ``url`` and return ``(status, body)``.
+    """
+    status, _, body = await fetch_response(session, url, headers, timeout, cache)
+    return status, body
+
+
+async def fetch_response(session, url, headers=None, timeout=10, cache=False):
+    """
+    GET ``url`` and return ``(status, response_headers, body)``.
+
+    The request waits for the host's shared rate limiter first.  With
+    ``cache`` it is sent as a conditional request and a 304 is answered from
+    ``http_cache`` as a 200.
+    """
+    if not cache:
+        return await _fetch_response(session, url, headers, timeout)
+
+    request_headers = headers
+    headers = {**(headers or {}), **http_cache.conditional_headers(url, request_headers)}
+    status, res_headers, body = await _fetch_response(session, url, headers, timeout)
+    if status == 200:
+        http_cache.store(url, res_headers, body, request_headers)
+    elif status == 304:
+        cached = http_cache.load(url, request_headers)
+        if cached is not None:
+            return (200,) + cached
+    return status, res_headers, body
+
+
+async def _fetch_response(session, url, headers, timeout):
+    limiter = ratelimit.get_limiter(url)
+    acquired = False
+    status = retry_after = None
+    try:
+        await limiter.acquire_async()
+        acquired = True
+        start = time.monotonic()
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        async with session.get(url, headers=headers, timeout=client_timeout) as res:
+            body = await res.read()
+            status = res.status
+            retry_after = ratelimit.parse_retry_after(res.headers)
+            return status, CaseInsensitiveDict(res.headers), body
+    except asyncio.CancelledError:
+        # 被取消不是对方限流，归还名额但不减速
+        if acquired:
+            acquired = False
+            limiter.cancel()
+        raise
+    finally:
+        if acquired:
+            limiter.release(status, time.monotonic() - start, retry_after=retry_after)
+
+
+async def _crawl(items, fetch_one, concurrency, desc, on_result):
+    if asyncio.get_running_loop() is _shared_loop:
+        return await _crawl_with(await _get_shared_session(), items, fetch_one, concurrency, desc, on_result)
+    # keep-alive 连接池，按 host 限制连接数
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency)
+    async with aiohttp.ClientSession(connector=connector, headers=http_client.DEFAULT_HEADERS) as session:
+        return await _crawl_with(session, items, fetch_one, concurrency, desc, on_result)
+
+
+async def _crawl_with(session, items, fetch_one, concurrency, desc, on_result):
+    # 每次 crawl 的并发数由自己的信号量限制，共享连接池时也是如此
+    semaphore = asyncio.Semaphore(concurrency)
+    with tqdm(total=len(items), desc=desc, disable=desc is None) as pbar:
+        async def worker(item):
+            async with semaphore:
+                result = await fetch_one(session, item)
+            pbar.update(1)
+            if on_result is None:
+                return result
+            # on_result 可能因下游队列已满而阻塞，放到线程里执行
+            await asyncio.to_thread(on_result, result)
+
+        results = await asyncio.gather(*(worker(item) for item in items))
+        return results if on_result is None else None
+
+
+async def _get_shared_session():
+    global _shared_session
+    if _shared_session is None:
+        connector = aiohttp.TCPConnector(limit=SHARED_CONNECTIONS)
+        _shared_session = aiohttp.ClientSession(connector=connector, headers=http_client.DEFAULT_HEADERS)
+    return _shared_session
+
+
+def start_shared_loop():
+    """
+    Starts the process-wide event loop that ``crawl`` uses from now on.
+    """
+    global _shared_loop, _shared_thread
+    if _shared_loop is not None:
+        return _shared_loop
+    loop = asyncio.new_event_loop()
+    _shared_thread = threading.Thread(target=loop.run_forever, name='event-loop', daemon=True)
+    _shared_thread.start()
+    _shared_loop = loop
+    return loop
+
+
+def stop_shared_loop():
+    """
+    Closes the shared connection pool and stops the shared loop.
+    """
+    global _shared_loop, _shared_thread, _shared_session
+    loop = _shared_loop
+    if loop is None:
+        return
+
+    async def close_session():
+        if _shared_session is not None:
+            await _shared_session.close()
+
+    asyncio.run_coroutine_threadsafe(close_session(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    _shared_thread.join()
+    loop.close()
+    _shared_loop = _shared_thread = _shared_session = None
+
+
+def crawl(items, fetch_one, concurrency=10, desc=None, on_result=None):
+    """
+    Run ``fetch_one(session, item)`` for every item concurrently.
+
+    Results keep the order of ``items``; ``desc`` enables a tqdm progress bar.
+    With ``on_result`` each result is handed over as soon as it is ready
+    instead of being collected, and nothing is returned.  While a shared loop
+    is running the crawl is scheduled on it and this call blocks until done.
+    """
+    coro = _crawl(list(items), fetch_one, concurrency, desc, on_result)
+    if _shared_loop is not None:
+        return asyncio.run_coroutine_threadsafe(coro, _shared_loop).result()
+    return asyncio.run(coro)
@@ -0,0 +1,102 @@
+"""
+Micro-benchmark for decoding jd comment pages.
+
+Compares the old replace + ``json.loads`` path with ``jd.decode_comments_page``
+on each available JSON backend.  Recorded responses are read from
+``benchmarks/data/jd/*.jsonp``; record some with
+
+    python benchmarks/jd_jsonp.py --record 100004972871
+
+Without recordings a synthetic page shaped like a jd response is used.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import http_client  # noqa: E402
+import jd  # noqa: E402
+import jsonp  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'jd')
+CALLBACK = 'fetchJSON_comment98'
+
+
+def record(product_id, pages=5):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    headers = {'User-Agent': http_client.DEFAULT_HEADERS['User-Agent']}
+    for page in range(pages):
+        url = ('https://club.jd.com/comment/productPageComments.action?callback=' + CALLBACK +
+               f'&productId={product_id}&score=0&sortType=5&page={page}&pageSize=10&isShadowSku=0&fold=1')
+        response = http_client.get_session('jd').get(url, headers=headers)
+        path = os.path.join(DATA_DIR, f'{product_id}_{page}.jsonp')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(response.text)
+        print(f'saved {path} ({len(response.text)} chars)')
+
+
+def synthetic_page():
+    comment = {
+        'id': 20866487123, 'guid': 'a' * 32, 'content': '手机很流畅，拍照效果好；屏幕显示细腻。' * 4,
+        'creationTime': '2024-10-01 12:00:00', 'isTop': False, 'referenceId': '100004972871',
+        'referenceName': 'Apple iPhone 11 (A2223) 128GB 黑色 移动联通电信4G手机 双卡双待', 'score': 5,
+        'status': 1, 'nickname': 'j***n', 'userClient': 4, 'images': [{'imgUrl': '//img30.360buyimg.com/x.jpg'}] * 3,
+        'productColor': '黑色', 'productSize': '128GB', 'location': '广东', 'mobileVersion': '13.0.4',
+        'extMap': {'buyCount': '1'}, 'afterDays': 0, 'plusAvailable': 201,
+    }
+    page = {
+        'productCommentSummary': {'commentCount': 2000000, 'goodRate': 0.97, 'defaultGoodCount': 1500000},
+        'hotCommentTagStatistics': [{'name': '外观漂亮', 'count': 1000}] * 10,
+        'maxPage': 100,
+        'comments': [dict(comment, id=comment['id'] + i) for i in range(10)],
+    }
+    return f'{CALLBACK}({json.dumps(page, ensure_ascii=False)});'
+
+
+def decode_old(text):
+    comment_data = json.loads(text.replace(CALLBACK + '(', '').replace(');', ''))
+    return [jd.comment_row(comment) for comment in comment_data['comments']]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--record', metavar='PRODUCT_ID', help='fetch and save some comment pages first')
+    parser.add_argument('--number', type=int, default=2000, help='decodes per measurement')
+    args = parser.parse_args()
+    if args.record:
+        record(args.record)
+
+    paths = sorted(glob.glob(os.path.join(DATA_DIR, '*.jsonp')))
+    if paths:
+        pages = []
+        for path in paths:
+            with open(path, encoding='utf-8') as f:
+                pages.append(f.read())
+        print(f'{len(pages)} recorded pages from {DATA_DIR}')
+    else:
+        pages = [synthetic_page()]
+        print('no recordings found, using a synthetic page')
+
+    def run(decode):
+        return min(timeit.repeat(lambda: [decode(page) for page in pages], number=args.number, repeat=5))
+
+    per_page = args.number * len(pages)
+    results = [('replace + json', run(decode_old))]
+    for backend in ('json', 'orjson'):
+        try:
+            jsonp.set_backend(backend)
+        except ValueError:
+            continue
+        results.append((f'slice + {backend}', run(jd.decode_comments_page)))
+
+    baseline = results[0][1]
+    for name, seconds in results:
+        print(f'{name:<16} {seconds / per_page * 1e6:8.1f} us/page  {baseline / seconds:5.2f}x')
+
+
+if __name__ == '__main__':
+    main()
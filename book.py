@@ -1,24 +1,73 @@
 import re
-import chardet
-import mysql.connector
+
 import requests
-from bs4 import BeautifulSoup
 from tqdm import tqdm
 
+import async_fetch
+import charset
+import http_client
+import pagination
+import parsing
+import pipeline
+import storage
+
+BASE_URL = 'http://bang.dangdang.com/books/fivestars/01.00.00.00.00.00-all-0-0-1-{}'
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36'
+}
+BOOK_COLUMNS = ('ranks', 'title', 'comments', 'author', 'publisher', 'publish_date', 'rating', 'price')
+# 首页读不到分页信息时使用的页数
+DEFAULT_PAGES = 25
+
 
 def fetch_books(page):
     """
     Fetches book data from a specific page of the website.
     """
-    base_url = 'http://bang.dangdang.com/books/fivestars/01.00.00.00.00.00-all-0-0-1-{}'
-    url = base_url.format(page)
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36'
-    }
-    res = requests.get(url, headers=headers)
-    encoding = chardet.detect(res.content)['encoding']
-    res.encoding = encoding
-    soup = BeautifulSoup(res.text, 'html.parser')
+    url = BASE_URL.format(page)
+    res = http_client.get_session('book').get(url, headers=HEADERS, cache=True)
+    res.encoding = charset.resolve_encoding(url, res.headers.get('Content-Type'), res.content)
+    return parse_books(res.text)
+
+
+def detect_page_count():
+    """
+    Reads the number of list pages from the pagination on page 1.
+    """
+    url = BASE_URL.format(1)
+    try:
+        res = http_client.get_session('book').get(url, headers=HEADERS, cache=True)
+    except requests.RequestException as e:
+        print(f"Could not detect page count: {e}")
+        return DEFAULT_PAGES
+    res.encoding = charset.resolve_encoding(url, res.headers.get('Content-Type'), res.content)
+    # 首页带 ETag 时会进入缓存，随后抓取第 1 页只是一次 304
+    return pagination.last_page_number(parsing.make_soup(res.text)) or DEFAULT_PAGES
+
+
+async def fetch_books_async(session, page):
+    """
+    Asyncio version of fetch_books, for use with async_fetch.crawl.
+    """
+    url = BASE_URL.format(page)
+    try:
+        status, res_headers, content = await async_fetch.fetch_response(
+            session, url, headers=HEADERS, cache=True)
+    except async_fetch.FETCH_ERRORS as e:
+        print(f"Error fetching page {page}: {e}")
+        return []
+    if status != 200:
+        print(f"Failed to fetch page {page}: {status}")
+        return []
+    return parse_books(charset.decode(url, res_headers.get('Content-Type'), content))
+
+
+def parse_books(html):
+    """
+    Parses the book rows out of a list page.
+    """
+    # 只构建 li 子树，页面其余部分不进入解析树
+    soup = parsing.make_soup(html, scope='li')
     books = soup.find_all('li')
 
     book_data = []
@@ -57,71 +106,48 @@ def fetch_books(page):
         except Exception as e:
             print(f"Error fetching book info: {e}")
 
-    # print(f"Page {page}: {len(book_data)} books fetched.")
     return book_data
 
 
-def batch_insert(cursor, book_data, batch_size=100):
-    """
-    Inserts book data into the database in batches.
-    """
-    insert_query = """
-    INSERT INTO books (ranks, title, comments, author, publisher, publish_date, rating, price)
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-    """
-    total_inserted = 0
-    for i in range(0, len(book_data), batch_size):
-        batch = book_data[i:i + batch_size]
-        try:
-            cursor.executemany(insert_query, batch)
-            inserted_count = len(batch)
-            total_inserted += inserted_count
-            print(f"Successfully inserted {inserted_count} records.")
-        except mysql.connector.Error as err:
-            print(f"Batch insert error: {err}")
-
-    return total_inserted
-
-
-def main():
+def main(use_async=True, concurrency=10):
     """
     Main function to scrape books and insert data into the database.
-    """
-    db_config = {
-        'host': '106.15.79.229',
-        'port': 3306,
-        'user': 'root',
-        'password': '910920',
-        'database': 'demo'
-    }
 
+    Returns True when the books table was replaced with the new data.
+    """
     # Connect to the database
-    db_connection = mysql.connector.connect(**db_config)
-    cursor = db_connection.cursor()
-
-    # Clear the table
-    cursor.execute("TRUNCATE TABLE books;")
-    db_connection.commit()
-    print('Data cleared!')
-
-    all_book_data = []
-    for i in tqdm(range(1, 26), desc="Fetching Books"):
-        book_data = fetch_books(i)
-        all_book_data.extend(book_data)
-
-    # Remove duplicate entries
-    # unique_books = list({tuple(book) for book in all_book_data})
-    # unique_books = list(dict.fromkeys(all_book_data))
-    # print(f"Total unique books fetched: {len(unique_books)}")
-
-    # Insert data in batches
-    total_inserted = batch_insert(cursor, all_book_data)
-    print(f"Total records inserted into the database: {total_inserted}")
-
-    # Commit and close the connection
-    db_connection.commit()
-    cursor.close()
-    db_connection.close()
+    db = storage.Database()
+    db.connect()
+    if db.conn is None:
+        return False
+
+    # Rows are loaded into a staging table by a writer thread while pages are still being
+    # fetched; the staging table replaces the live one only after the whole crawl succeeds
+    try:
+        pages = range(1, detect_page_count() + 1)
+        failed_pages = 0
+        with db.staging_load('books', BOOK_COLUMNS) as loader, pipeline.RowPipeline(loader.add) as rows_pipeline:
+            def on_page(rows):
+                nonlocal failed_pages
+                # Every page up to the last one in the pagination has books; an empty page
+                # means the request failed or was blocked
+                if not rows:
+                    failed_pages += 1
+                rows_pipeline.put(rows)
+
+            if use_async:
+                async_fetch.crawl(pages, fetch_books_async, concurrency, desc="Fetching Books",
+                                  on_result=on_page)
+            else:
+                for i in tqdm(pages, desc="Fetching Books"):
+                    on_page(fetch_books(i))
+            if failed_pages:
+                loader.abort(f"{failed_pages} of {len(pages)} pages failed")
+    finally:
+        db.close()
+
+    print(f"Total records inserted into the database: {loader.total}")
+    return loader.swapped
 
 
 if __name__ == "__main__":
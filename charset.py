@@ -0,0 +1,90 @@
+"""
+Cheap encoding resolution for HTML responses.
+
+The Content-Type header and ``<meta charset>`` are tried first.  Only when
+neither declares a charset is chardet run, and then only over a bounded prefix
+of the body (the whole body if that prefix is pure ASCII); a confident guess
+is remembered per host, because every page of a site normally uses the same
+encoding.  Guesses from ASCII-only bodies are never remembered, since they
+say nothing about the pages that do contain non-ASCII text.
+"""
+import codecs
+import re
+import threading
+from urllib.parse import urlsplit
+
+import chardet
+
+# 需要猜测编码时最多扫描的字节数
+SNIFF_BYTES = 4096
+# chardet 的置信度低于该值时不按 host 缓存
+MIN_CONFIDENCE = 0.3
+
+# GB2312/GBK 声明的页面常常包含超出字符集的字，统一用超集 GB18030 解码
+ALIASES = {
+    'gb2312': 'gb18030',
+    'gbk': 'gb18030',
+    'ascii': 'utf-8',
+}
+
+_HEADER_RE = re.compile(r'charset=["\']?([\w.:-]+)', re.I)
+_META_RE = re.compile(rb'<meta[^>]+charset=["\']?([\w.:-]+)', re.I)
+
+_host_encodings = {}
+_lock = threading.Lock()
+
+
+def normalize(name):
+    """
+    Returns the canonical codec name for ``name``, or None if Python doesn't know it.
+    """
+    if not name:
+        return None
+    if isinstance(name, bytes):
+        name = name.decode('ascii', errors='ignore')
+    try:
+        name = codecs.lookup(name.strip().lower()).name
+    except LookupError:
+        return None
+    return ALIASES.get(name, name)
+
+
+def resolve_encoding(url, content_type, content):
+    """
+    Returns the encoding to decode ``content`` (the body of ``url``) with.
+    """
+    match = _HEADER_RE.search(content_type or '')
+    encoding = normalize(match.group(1)) if match else None
+    if encoding:
+        return encoding
+
+    match = _META_RE.search(content[:SNIFF_BYTES])
+    encoding = normalize(match.group(1)) if match else None
+    if encoding:
+        return encoding
+
+    host = urlsplit(url).hostname or ''
+    with _lock:
+        encoding = _host_encodings.get(host)
+    if encoding:
+        return encoding
+
+    sample = content[:SNIFF_BYTES]
+    if sample.isascii():
+        # 前缀全是 ASCII 说明不了编码，改为检测整个正文
+        sample = content
+        if sample.isascii():
+            return 'utf-8'
+    guess = chardet.detect(sample)
+    encoding = normalize(guess['encoding']) or 'utf-8'
+    if (guess['confidence'] or 0) >= MIN_CONFIDENCE:
+        with _lock:
+            _host_encodings[host] = encoding
+    return encoding
+
+
+def decode(url, content_type, content):
+    """
+    Decodes a response body, replacing bytes that don't fit the resolved encoding.
+    """
+    return content.decode(resolve_encoding(url, content_type, content), errors='replace')
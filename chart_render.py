@@ -0,0 +1,130 @@
+"""
+Chart snapshots through a pool of warm headless browsers.
+
+``make_snapshot`` from snapshot_selenium starts a new Chrome for every chart
+when it isn't given a driver, and browser startup dominates the render time.
+``BrowserPool`` keeps a few drivers alive and lends them out; every chart is
+written to its own temporary HTML file, so ``render_all`` can snapshot a
+whole batch of charts concurrently.
+"""
+import os
+import queue
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# 关闭动画后图表在页面加载完成时就已画好，只需短暂等待
+RENDER_DELAY = 0.5
+
+
+def chrome_driver():
+    from selenium import webdriver
+
+    options = webdriver.ChromeOptions()
+    options.add_argument('--headless=new')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    return webdriver.Chrome(options=options)
+
+
+class BrowserPool:
+    """
+    Up to ``size`` browser drivers, created on first use and reused afterwards.
+    """
+
+    def __init__(self, size=2, factory=chrome_driver):
+        self.size = size
+        self.factory = factory
+        self.idle = queue.Queue()
+        self.drivers = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def driver(self):
+        """
+        Lends out a driver; a driver that raised is replaced instead of reused.
+        """
+        driver = self._get()
+        try:
+            yield driver
+        except Exception:
+            self._discard(driver)
+            raise
+        self.idle.put(driver)
+
+    def _get(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if len(self.drivers) < self.size:
+                driver = self.factory()
+                self.drivers.append(driver)
+                return driver
+        return self.idle.get()
+
+    def _discard(self, driver):
+        with self.lock:
+            if driver in self.drivers:
+                self.drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def close(self):
+        with self.lock:
+            drivers, self.drivers = self.drivers, []
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def render(chart, output_path, pool, delay=RENDER_DELAY):
+    """
+    Snapshots a pyecharts chart to ``output_path`` (png/jpeg/svg/pdf) with a pooled browser.
+    """
+    from pyecharts.render import make_snapshot
+    from snapshot_selenium import snapshot
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    # 每个图表用独立的临时文件，多个图表可以同时渲染
+    fd, html_path = tempfile.mkstemp(suffix='.html', prefix='chart_')
+    os.close(fd)
+    try:
+        chart.render(html_path)
+        with pool.driver() as driver:
+            make_snapshot(snapshot, html_path, output_path, delay=delay, driver=driver)
+    finally:
+        os.remove(html_path)
+    return output_path
+
+
+def render_all(jobs, pool=None, pool_size=2, delay=RENDER_DELAY):
+    """
+    Renders ``(chart, output_path)`` pairs concurrently; returns the output paths.
+
+    Without ``pool`` a temporary pool of ``pool_size`` browsers is used and
+    closed afterwards.
+    """
+    jobs = list(jobs)
+    own_pool = pool is None
+    if own_pool:
+        pool = BrowserPool(pool_size)
+    try:
+        with ThreadPoolExecutor(max_workers=pool.size) as executor:
+            futures = [executor.submit(render, chart, path, pool, delay) for chart, path in jobs]
+            return [future.result() for future in futures]
+    finally:
+        if own_pool:
+            pool.close()
@@ -0,0 +1,267 @@
+"""
+Browserless chart output: bar charts and word clouds as SVG or PNG.
+
+The SVG backend is pure Python.  The PNG backend draws the same layout with
+matplotlib, which is only imported when PNG output is requested.  Neither
+needs Selenium or a browser binary, so rendering takes milliseconds instead of
+a browser start plus a page load per chart.
+"""
+import math
+import os
+from xml.sax.saxutils import escape
+
+FONT_FAMILY = "PingFang SC, Microsoft YaHei, Noto Sans CJK SC, WenQuanYi Micro Hei, sans-serif"
+# matplotlib 需要能显示中文的字体，按顺序取第一个已安装的
+MPL_FONTS = ['PingFang SC', 'Microsoft YaHei', 'Noto Sans CJK SC', 'WenQuanYi Micro Hei', 'SimHei',
+             'DejaVu Sans']
+PALETTE = ['#5470c6', '#91cc75', '#fac858', '#ee6666', '#73c0de', '#3ba272', '#fc8452', '#9a60b4', '#ea7ccc']
+
+BAR_SIZE = (900, 500)
+CLOUD_SIZE = (800, 600)
+# 与 pyecharts 词云的 word_size_range 一致
+WORD_SIZE_RANGE = (20, 100)
+# 与 pyecharts 词云一样最多取前 1000 个词；画布放满后剩下的词会被 MAX_MISSES 提前截止
+MAX_WORDS = 1000
+# 螺旋线相邻两圈的间距（像素）
+SPIRAL_GAP = 12
+# 每个词沿螺旋线最多尝试的位置数
+MAX_STEPS = 3000
+# 连续这么多个词放不下就认为画布已满
+MAX_MISSES = 30
+
+
+def text_width(text, size):
+    """
+    Rough rendered width: CJK characters are square, others about half as wide.
+    """
+    return sum(size if ord(ch) > 0x2e80 else size * 0.6 for ch in str(text))
+
+
+def _items(counts):
+    return [(str(label), value) for label, value in counts.items()]
+
+
+def _sorted_counts(counts):
+    return sorted(_items(counts), key=lambda item: -item[1])
+
+
+def _nice_max(value):
+    if value <= 0:
+        return 1
+    magnitude = 10 ** math.floor(math.log10(value))
+    for step in (1, 2, 2.5, 5, 10):
+        if value <= step * magnitude:
+            return step * magnitude
+    return 10 * magnitude
+
+
+def bar_layout(counts, width, height):
+    """
+    Bar geometry shared by both backends.
+
+    Returns ``(bars, ticks, rotate)``: bars are ``(label, value, x, y, w, h)``
+    in pixels (origin top-left), ticks are ``(value, y)``.  Bars keep the
+    order of ``counts``, like the pyecharts bar chart.
+    """
+    items = _items(counts)
+    rotate = len(items) > 10
+    left, right, top = 60, 20, 50
+    bottom = 110 if rotate else 40
+    plot_w, plot_h = width - left - right, height - top - bottom
+    y_max = _nice_max(max((value for _, value in items), default=0))
+
+    slot = plot_w / max(len(items), 1)
+    bars = []
+    for i, (label, value) in enumerate(items):
+        h = plot_h * value / y_max
+        bars.append((label, value, left + slot * (i + 0.2), top + plot_h - h, slot * 0.6, h))
+    ticks = [(y_max * i / 5, top + plot_h - plot_h * i / 5) for i in range(6)]
+    return bars, ticks, rotate
+
+
+def word_cloud_layout(counts, width, height, max_words=MAX_WORDS, size_range=WORD_SIZE_RANGE, reserved=()):
+    """
+    Places words on an Archimedean spiral from the centre, biggest first.
+
+    Returns ``(word, font_size, x, y)`` with ``(x, y)`` the text's top-left
+    corner; words that don't fit are left out.  ``reserved`` boxes
+    ``(x0, y0, x1, y1)`` (e.g. the title) are kept free.
+    """
+    items = _sorted_counts(counts)[:max_words]
+    if not items:
+        return []
+    low, high = items[-1][1], items[0][1]
+    min_size, max_size = size_range
+    cell = 40
+    grid = {}
+    placed = []
+
+    def occupy(box):
+        for gx in range(int(box[0] // cell), int(box[2] // cell) + 1):
+            for gy in range(int(box[1] // cell), int(box[3] // cell) + 1):
+                grid.setdefault((gx, gy), []).append(box)
+
+    for box in reserved:
+        occupy(box)
+
+    def collides(box):
+        x0, y0, x1, y1 = box
+        for gx in range(int(x0 // cell), int(x1 // cell) + 1):
+            for gy in range(int(y0 // cell), int(y1 // cell) + 1):
+                for ox0, oy0, ox1, oy1 in grid.get((gx, gy), ()):
+                    if x0 < ox1 and ox0 < x1 and y0 < oy1 and oy0 < y1:
+                        return True
+        return False
+
+    max_radius = math.hypot(width, height) / 2
+    turn = SPIRAL_GAP / (2 * math.pi)
+    # 词按字号从大到小摆放，中心附近很快被占满；每个词从上一个词所在半径的一半处开始找位置
+    start_radius = 0.0
+    misses = 0
+    for i, (word, value) in enumerate(items):
+        ratio = (value - low) / (high - low) if high > low else 1.0
+        size = round(min_size + (max_size - min_size) * ratio)
+        w, h = text_width(word, size), size * 1.1
+        if w > width or h > height:
+            continue
+        angle = start_radius * 0.5 / turn + i * 0.7  # 不同的起始角度让词分布得更均匀
+        step = max(4.0, size / 4)
+        fitted = False
+        for _ in range(MAX_STEPS):
+            radius = turn * angle
+            if radius > max_radius:
+                break
+            x = width / 2 + radius * math.cos(angle) - w / 2
+            y = height / 2 + radius * math.sin(angle) * height / width - h / 2
+            box = (x, y, x + w, y + h)
+            if x >= 0 and y >= 0 and x + w <= width and y + h <= height and not collides(box):
+                occupy(box)
+                placed.append((word, size, x, y))
+                start_radius = radius
+                fitted = True
+                break
+            # 沿螺旋线大约每 step 像素尝试一次
+            angle += step / max(radius, step)
+        misses = 0 if fitted else misses + 1
+        if misses >= MAX_MISSES:
+            break
+    return placed
+
+
+def _svg_document(width, height, body):
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'viewBox="0 0 {width} {height}" font-family="{FONT_FAMILY}">\n'
+            f'<rect width="100%" height="100%" fill="white"/>\n' + '\n'.join(body) + '\n</svg>\n')
+
+
+def bar_svg(counts, title):
+    width, height = BAR_SIZE
+    bars, ticks, rotate = bar_layout(counts, width, height)
+    body = [f'<text x="{width / 2}" y="28" font-size="18" font-weight="bold" text-anchor="middle">'
+            f'{escape(title.strip())}</text>']
+    for value, y in ticks:
+        body.append(f'<line x1="60" y1="{y:.1f}" x2="{width - 20}" y2="{y:.1f}" stroke="#e0e6f1"/>')
+        body.append(f'<text x="54" y="{y + 4:.1f}" font-size="12" text-anchor="end" fill="#6e7079">'
+                    f'{value:g}</text>')
+    for i, (label, value, x, y, w, h) in enumerate(bars):
+        body.append(f'<rect x="{x:.1f}" y="{y:.1f}" width="{w:.1f}" height="{h:.1f}" '
+                    f'fill="{PALETTE[i % len(PALETTE)]}"><title>{escape(label)}: {value}</title></rect>')
+        cx, base = x + w / 2, ticks[0][1] + 16
+        if rotate:
+            body.append(f'<text x="{cx:.1f}" y="{base:.1f}" font-size="12" text-anchor="end" fill="#6e7079" '
+                        f'transform="rotate(-45 {cx:.1f} {base:.1f})">{escape(label)}</text>')
+        else:
+            body.append(f'<text x="{cx:.1f}" y="{base:.1f}" font-size="12" text-anchor="middle" '
+                        f'fill="#6e7079">{escape(label)}</text>')
+    return _svg_document(width, height, body)
+
+
+def _title_box(title):
+    return 0, 0, 20 + text_width(title, 18), 34
+
+
+def word_cloud_svg(counts, title="Comments WordCloud"):
+    width, height = CLOUD_SIZE
+    body = [f'<text x="10" y="24" font-size="18" font-weight="bold">{escape(title)}</text>']
+    layout = word_cloud_layout(counts, width, height, reserved=[_title_box(title)])
+    for i, (word, size, x, y) in enumerate(layout):
+        body.append(f'<text x="{x:.1f}" y="{y + size * 0.9:.1f}" font-size="{size}" '
+                    f'fill="{PALETTE[i % len(PALETTE)]}">{escape(word)}</text>')
+    return _svg_document(width, height, body)
+
+
+def _pyplot():
+    try:
+        import matplotlib
+    except ImportError:
+        raise RuntimeError("PNG output needs matplotlib (pip install matplotlib); use SVG instead") from None
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    plt.rcParams['font.sans-serif'] = MPL_FONTS
+    plt.rcParams['axes.unicode_minus'] = False
+    return plt
+
+
+def _figure(plt, size, dpi):
+    width, height = size
+    return plt.figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+
+
+def bar_png(counts, title, path, dpi=100):
+    plt = _pyplot()
+    fig = _figure(plt, BAR_SIZE, dpi)
+    ax = fig.add_subplot(111)
+    items = _items(counts)
+    ax.bar(range(len(items)), [value for _, value in items],
+           color=[PALETTE[i % len(PALETTE)] for i in range(len(items))])
+    rotate = len(items) > 10
+    ax.set_xticks(range(len(items)))
+    ax.set_xticklabels([label for label, _ in items], rotation=45 if rotate else 0,
+                       ha='right' if rotate else 'center')
+    ax.set_title(title.strip())
+    fig.tight_layout()
+    fig.savefig(path, dpi=dpi)
+    plt.close(fig)
+
+
+def word_cloud_png(counts, path, title="Comments WordCloud", dpi=100):
+    plt = _pyplot()
+    width, height = CLOUD_SIZE
+    fig = _figure(plt, CLOUD_SIZE, dpi)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_xlim(0, width)
+    ax.set_ylim(height, 0)
+    ax.axis('off')
+    ax.text(10, 24, title, fontsize=18 * 72 / dpi, fontweight='bold', va='baseline')
+    layout = word_cloud_layout(counts, width, height, reserved=[_title_box(title)])
+    for i, (word, size, x, y) in enumerate(layout):
+        # 布局按像素计算，matplotlib 字号单位是磅
+        ax.text(x, y, word, fontsize=size * 72 / dpi, va='top', color=PALETTE[i % len(PALETTE)])
+    fig.savefig(path, dpi=dpi, facecolor='white')
+    plt.close(fig)
+
+
+def save_bar(counts, title, path):
+    """
+    Writes a bar chart of ``{label: count}``; the format follows the extension (.svg or .png).
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if path.endswith('.svg'):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(bar_svg(counts, title))
+    else:
+        bar_png(counts, title, path)
+    return path
+
+
+def save_word_cloud(counts, path):
+    """
+    Writes a word cloud of ``{word: count}``; the format follows the extension (.svg or .png).
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if path.endswith('.svg'):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(word_cloud_svg(counts))
+    else:
+        word_cloud_png(counts, path)
+    return path
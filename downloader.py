@@ -0,0 +1,124 @@
+"""
+Resumable streaming downloads for large files.
+
+The body is copied to ``<dest>.part`` in 1 MB blocks and renamed to ``dest``
+only once its length matches ``Content-Length``.  If the transfer breaks, the
+next attempt (or the next run) continues from the bytes already on disk with
+an HTTP ``Range`` request instead of starting over.
+
+Downloads ask for ``Accept-Encoding: identity`` so the bytes on disk are the
+bytes ``Content-Length`` and ``Range`` count.  Concurrent downloads to the
+same destination in one process run one after the other, because they share
+the ``.part`` file.
+"""
+import os
+import re
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+import urllib3
+
+CHUNK_SIZE = 1 << 20
+
+# 除了这些状态码，其余 4xx 重试也没有意义
+RETRY_STATUS = {408, 429}
+
+# 传输中断时可能抛出的异常
+TRANSFER_ERRORS = (requests.RequestException, urllib3.exceptions.HTTPError)
+
+_CONTENT_RANGE_RE = re.compile(r'bytes (\d+)-\d+/(\d+|\*)')
+
+# .part 路径 -> [锁, 使用者数]
+_part_locks = {}
+_part_locks_lock = threading.Lock()
+
+
+class IncompleteDownload(requests.RequestException):
+    """Raised when a file could not be downloaded completely."""
+
+
+def _expected_size(response, offset):
+    if response.status_code == 206:
+        match = _CONTENT_RANGE_RE.match(response.headers.get('Content-Range', ''))
+        if match and match.group(2) != '*':
+            return int(match.group(2))
+    length = response.headers.get('Content-Length')
+    if length is None or response.headers.get('Content-Encoding', 'identity') != 'identity':
+        # 压缩传输时 Content-Length 是压缩后的长度，无法用来校验
+        return None
+    return offset + int(length)
+
+
+@contextmanager
+def _locked(path):
+    with _part_locks_lock:
+        entry = _part_locks.setdefault(path, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _part_locks_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _part_locks[path]
+
+
+def download(session, url, dest, headers=None, retries=3, timeout=30, chunk_size=CHUNK_SIZE):
+    """
+    Downloads ``url`` to ``dest`` through ``<dest>.part``; returns ``dest``.
+
+    Raises IncompleteDownload (a ``requests.RequestException``) once all
+    attempts are used up; the partial file is kept for the next run.
+    """
+    part_path = dest + '.part'
+    # 同一个 .part 文件同时只允许一个线程写入，否则后来的线程会用 'wb' 截断它
+    with _locked(os.path.abspath(part_path)):
+        return _download(session, url, dest, part_path, headers, retries, timeout, chunk_size)
+
+
+def _download(session, url, dest, part_path, headers, retries, timeout, chunk_size):
+    error = None
+    for attempt in range(retries):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        # 不要压缩传输：写入的字节数要和 Content-Length、Range 的偏移一致
+        request_headers = {'Accept-Encoding': 'identity', **(headers or {})}
+        if offset:
+            request_headers['Range'] = f'bytes={offset}-'
+        try:
+            with session.get(url, headers=request_headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 416:
+                    # 服务器不接受这个 Range，说明本地残留文件已失效，重新下载
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+                    continue
+                if 400 <= response.status_code < 500 and response.status_code not in RETRY_STATUS:
+                    error = requests.HTTPError(f"HTTP {response.status_code}", response=response)
+                    break
+                response.raise_for_status()
+                if response.status_code != 206:
+                    offset = 0
+                if response.headers.get('Content-Encoding', 'identity') != 'identity':
+                    # 服务器仍然压缩了响应：解压后写入，长度无法校验，也不能续传
+                    offset = 0
+                    response.raw.decode_content = True
+                expected = _expected_size(response, offset)
+                with open(part_path, 'ab' if offset else 'wb') as f:
+                    shutil.copyfileobj(response.raw, f, chunk_size)
+        except TRANSFER_ERRORS as e:
+            error = e
+            time.sleep(min(2 ** attempt, 10))
+            continue
+
+        size = os.path.getsize(part_path)
+        if expected is None or size == expected:
+            os.replace(part_path, dest)
+            return dest
+        if size > expected:
+            os.remove(part_path)
+        error = IncompleteDownload(f"{url}: got {size} of {expected} bytes")
+
+    raise IncompleteDownload(f"Failed to download {url}: {error}")
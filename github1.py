@@ -1,88 +1,47 @@
-import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
 
-import mysql.connector
 import requests
-from dotenv import load_dotenv
 from tqdm import tqdm
 
-db_config = {
-    'host': '106.15.79.229',
-    'port': 3306,
-    'user': 'root',
-    'password': '910920',
-    'database': 'demo'
+import github_api
+import http_client
+import pipeline
+import storage
+
+USER_COLUMNS = ('login', 'userid', 'username', 'followers', 'following', 'location', 'email',
+                'public_repos', 'public_gists')
+
+SEARCH_URL = 'https://api.github.com/search/users'
+GRAPHQL_URL = 'https://api.github.com/graphql'
+# 每次 GraphQL 请求查询的用户数，GitHub 对单次查询的节点数有上限
+GRAPHQL_BATCH = 50
+# 与 REST /users/{login} 返回的字段一一对应
+USER_FRAGMENT = """
+fragment UserFields on User {
+  login
+  databaseId
+  name
+  followers { totalCount }
+  following { totalCount }
+  location
+  email
+  repositories(privacy: PUBLIC, ownerAffiliations: OWNER) { totalCount }
+  gists(privacy: PUBLIC) { totalCount }
 }
+"""
 
 
-def github_token():
-    # 加载 .env 文件
-    load_dotenv()
-    # 获取 GitHub 令牌
-    token = os.getenv('GITHUB_TOKEN')
-    return token
-
-
-class Database:
-    def __init__(self):
-        self.conn = None
-
-    def connect(self):
-        try:
-            self.conn = mysql.connector.connect(**db_config)
-        except mysql.connector.Error as e:
-            print(f'连接数据库失败：{e}')
-
-    def clear_table(self):
-        cursor = self.conn.cursor()
-        try:
-            cursor.execute("TRUNCATE TABLE github_users;")
-            print('数据已清除!!!')
-            self.conn.commit()
-        except mysql.connector.Error as e:
-            print(f'清空表数据失败：{e}')
-        finally:
-            cursor.close()
-
-    def insert_users(self, users_data):
-        if not users_data:
-            print("No data to insert.")
-            return
-
-        cursor = self.conn.cursor()
-        sql = """
-            INSERT INTO github_users (
-                login, userid, username, followers, following, location, email,
-                public_repos, public_gists
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-              """
-
-        # 将数据分成每100条一组
-        batch_size = 20
-        total_inserted = 0
-        try:
-            for i in range(0, len(users_data), batch_size):
-                batch = users_data[i:i + batch_size]
-                cursor.executemany(sql, batch)
-                self.conn.commit()
-                total_inserted += len(batch)
-                print(f"Successfully inserted {len(batch)} records.")
-
-            print(f"Total records inserted: {total_inserted}")
-        except mysql.connector.Error as e:
-            print(f'批量插入数据失败：{e}')
-            self.conn.rollback()
-        finally:
-            cursor.close()
-
-    def close(self):
-        if self.conn:
-            self.conn.close()
+class Database(storage.Database):
+    def users_loader(self):
+        """影子表加载器：爬取期间旧数据保持可读，完成后整体替换 github_users"""
+        return self.staging_load('github_users', USER_COLUMNS)
 
 
 def fetch_user_details(user_url, headers):
     """获取单个用户详细信息"""
-    user_details_response = requests.get(user_url, headers=headers)
+    # 条件请求命中 304 时不消耗 GitHub 的请求配额；令牌和限速由 github_api 统一调度
+    user_details_response = github_api.request(http_client.get_session('github1'), 'GET', user_url,
+                                               headers=headers, cache=True)
     if user_details_response.status_code == 200:
         user_details = user_details_response.json()
         return (
@@ -99,59 +58,177 @@ def fetch_user_details(user_url, headers):
     return None
 
 
-def fetch_all_user_details(user_urls, thread_count, headers, pbar):
-    """使用多线程获取所有用户的详细信息"""
-    with ThreadPoolExecutor(max_workers=thread_count) as executor:
-        futures = {executor.submit(fetch_user_details, url, headers): url for url in user_urls}
-        for future in as_completed(futures):
-            user_data = future.result()
-            if user_data:
-                pbar.update(1)
-                yield user_data
-
-
-def get_top_followed_users(thread_count=2):
-    token = github_token()
+def user_row_from_graphql(user):
+    """把 GraphQL 的 User 节点转换成与 fetch_user_details 相同的 9 字段元组"""
+    return (
+        user.get('login'),
+        user.get('databaseId'),
+        user.get('name'),
+        user['followers']['totalCount'],
+        user['following']['totalCount'],
+        user.get('location'),
+        # 未公开邮箱时 GraphQL 返回空字符串，REST 返回 null
+        user.get('email') or None,
+        user['repositories']['totalCount'],
+        user['gists']['totalCount']
+    )
+
+
+def users_query(logins):
+    """为每个 login 生成一个带别名的 user(login:) 字段，login 通过变量传入"""
+    variables = ', '.join(f'$l{i}: String!' for i in range(len(logins)))
+    fields = '\n'.join(f'  u{i}: user(login: $l{i}) {{ ...UserFields }}' for i in range(len(logins)))
+    query = f'query({variables}) {{\n{fields}\n}}\n{USER_FRAGMENT}'
+    return query, {f'l{i}': login for i, login in enumerate(logins)}
+
+
+def fetch_users_batch(logins, headers, graphql_url=GRAPHQL_URL):
+    """
+    一次 GraphQL 请求获取一批用户的详细信息，返回 login -> 9 字段元组
+
+    查不到的 login（例如组织账号）不在结果中，由调用方回退到 REST。
+    """
+    query, variables = users_query(logins)
+    response = github_api.request(http_client.get_session('github1'), 'POST', graphql_url,
+                                  headers=headers, json={'query': query, 'variables': variables})
+    if response.status_code != 200:
+        print(f"GraphQL request failed: {response.status_code}")
+        return {}
+
+    data = response.json().get('data') or {}
+    rows = {}
+    for i, login in enumerate(logins):
+        user = data.get(f'u{i}')
+        if user:
+            rows[login] = user_row_from_graphql(user)
+    return rows
+
+
+def fetch_users_graphql(user_urls, headers, graphql_url=GRAPHQL_URL):
+    """用一次 GraphQL 请求获取一批用户信息，批量结果缺失的用户逐个走 REST"""
+    logins = [url.rstrip('/').rsplit('/', 1)[-1] for url in user_urls]
+    rows = fetch_users_batch(logins, headers, graphql_url)
+    users = []
+    for login, url in zip(logins, user_urls):
+        user_data = rows.get(login) or fetch_user_details(url, headers)
+        if user_data:
+            users.append(user_data)
+    return users
+
+
+def fetch_user_rows(user_url, headers):
+    """REST 模式下的单用户任务，返回值与 fetch_users_graphql 一样是行列表"""
+    user_data = fetch_user_details(user_url, headers)
+    return [user_data] if user_data else []
+
+
+def iter_search_user_urls(session, headers, max_users=1000, per_page=100):
+    """
+    逐页产出搜索结果中的用户 URL
+
+    搜索接口最多返回前 1000 条结果，每页最多 100 条。某一页请求失败时抛出 requests.HTTPError。
+    """
     params = {
         'q': 'repos:>0',  # 只搜索至少有一个仓库的用户
         'sort': 'followers',  # 按关注者数量排序
         'order': 'desc',  # 降序
-        'per_page': 10,  # 每页返回10个结果
+        'per_page': per_page,
     }
+    total_pages = -(-max_users // per_page)
+    for page in range(1, total_pages + 1):
+        # 被限流时 github_api 会等到配额恢复后重试
+        response = github_api.request(session, 'GET', SEARCH_URL, headers=headers, params={**params, 'page': page},
+                                      cache=True)
+
+        if response.status_code != 200:
+            # 已经产出的用户仍然有效，由调用方决定是否保留
+            raise requests.HTTPError(f"Failed to retrieve data on page {page}: {response.status_code}",
+                                     response=response)
+
+        users = response.json().get('items', [])  # 获取用户列表
+        yield [user.get('url') for user in users][:max_users - (page - 1) * per_page]
+        if len(users) < per_page:
+            return
+
+
+def get_top_followed_users(thread_count=10, use_graphql=False, graphql_url=GRAPHQL_URL, max_users=1000,
+                           on_rows=None):
+    """
+    获取关注者最多的用户
+
+    搜索结果按 100 条一页获取，所有用户交给同一个长期存在的线程池，
+    下一页搜索进行时上一页的详情仍在并发获取。
+    use_graphql=True 时每 GRAPHQL_BATCH 个用户通过一次 GraphQL 请求批量获取。
+    搜索页或详情批次失败时打印错误并跳过，已获取的用户保留。
+    传入 on_rows 时每批结果到达就交给它（例如写库流水线），函数返回失败的请求数；
+    否则返回全部用户列表。
+    """
     headers = {
         'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36',
-        'Authorization': f'token {token}'  # 使用格式化字符串插入令牌
+        # Authorization 由 github_api 按可用配额从 .env 的令牌中选择
     }
 
-    url = "https://api.github.com/search/users"
+    # 连接池大小与线程数一致，所有请求复用同一批连接
+    session = http_client.get_session('github1', pool_size=thread_count + 1)
     top_users = []  # 用于存储关注者最多的用户信息
+    failed = 0
+
+    with tqdm(total=max_users, desc="Fetching user details") as pbar, \
+            pipeline.BoundedExecutor(thread_count, thread_name_prefix='github1') as executor:
+        lock = threading.Lock()
+
+        def on_done(future):
+            nonlocal failed
+            try:
+                users = future.result()
+            except Exception as e:
+                print(f"Failed to fetch user details: {e}")
+                with lock:
+                    failed += 1
+                return
+            with lock:
+                pbar.update(len(users))
+                if on_rows is None:
+                    top_users.extend(users)
+            if on_rows is not None:
+                on_rows(users)
 
-    total_pages = 10
-    total_users = total_pages * params['per_page']
-    with tqdm(total=total_users, desc="Fetching user details") as pbar:
-        for page in range(1, total_pages + 1):  # 获取前5页数据
-            params['page'] = page
-            response = requests.get(url, headers=headers, params=params)
-
-            if response.status_code != 200:
-                print(f"Failed to retrieve data on page {page}: {response.status_code}")
-                return []
-
-            users = response.json().get('items', [])  # 获取用户列表
-            user_urls = [user.get('url') for user in users]  # 提取用户 URL 列表
-
-            # 获取用户详细信息
-            top_users.extend(fetch_all_user_details(user_urls, thread_count, headers, pbar))
-
-    return top_users
-
-
-if __name__ == '__main__':
+        try:
+            for user_urls in iter_search_user_urls(session, headers, max_users):
+                if use_graphql:
+                    for start in range(0, len(user_urls), GRAPHQL_BATCH):
+                        batch = user_urls[start:start + GRAPHQL_BATCH]
+                        executor.submit(fetch_users_graphql, batch, headers, graphql_url).add_done_callback(on_done)
+                else:
+                    for user_url in user_urls:
+                        executor.submit(fetch_user_rows, user_url, headers).add_done_callback(on_done)
+        except requests.RequestException as e:
+            print(e)
+            with lock:
+                failed += 1
+
+    return failed if on_rows is not None else top_users
+
+
+def main(thread_count=10):
+    """返回 True 表示 github_users 已替换为新数据"""
     db = Database()
     db.connect()
+    if db.conn is None:
+        return False
+
+    # 用户详情边获取边写入影子表，爬取期间旧数据保持可读，完成后再整体替换
+    try:
+        with db.users_loader() as loader, pipeline.RowPipeline(loader.add) as rows_pipeline:
+            failed = get_top_followed_users(thread_count=thread_count, use_graphql=True, on_rows=rows_pipeline.put)
+            if failed:
+                # 缺了部分用户的榜单不能替换现有数据
+                loader.abort(f"{failed} requests failed")
+        print(f"Total records loaded: {loader.total}")
+    finally:
+        db.close()
+    return loader.swapped
 
-    db.clear_table()
-    all_user = get_top_followed_users(thread_count=10)
 
-    db.insert_users(all_user)
-    db.close()
+if __name__ == '__main__':
+    main()
@@ -5,92 +5,30 @@ Created on 2024/10/27 00:13
 @python_version: 3.13
 Description: This is a description of the content.
 """
-import os
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import mysql.connector
-import requests
-from dotenv import load_dotenv
 from tqdm import tqdm
 
-db_config = {
-    'host': '106.15.79.229',
-    'port': 3306,
-    'user': 'root',
-    'password': '910920',
-    'database': 'demo'
-}
-
-
-def github_token():
-    # 加载 .env 文件
-    load_dotenv()
-    # 获取 GitHub 令牌
-    token = os.getenv('GITHUB_TOKEN')
-    return token
-
-
-class Database:
-    def __init__(self):
-        self.conn = None
-
-    def connect(self):
-        try:
-            self.conn = mysql.connector.connect(**db_config)
-        except mysql.connector.Error as e:
-            print(f'Failed to connect to the database: {e}')
-
-    def clear_table(self):
-        cursor = self.conn.cursor()
-        try:
-            cursor.execute("TRUNCATE TABLE github_stars;")
-            print('Table data cleared!')
-            self.conn.commit()
-        except mysql.connector.Error as e:
-            print(f'Failed to clear table data: {e}')
-        finally:
-            cursor.close()
-
-    def batch_insert(self, sql, data, batch_size=20):
-        """Generic method to insert data in batches to avoid duplication."""
-        cursor = self.conn.cursor()
-        total_inserted = 0
-        try:
-            for i in range(0, len(data), batch_size):
-                batch = data[i:i + batch_size]
-                cursor.executemany(sql, batch)
-                self.conn.commit()
-                total_inserted += len(batch)
-                print(f"Inserted {len(batch)} records in batch.")
-
-            print(f"Total records inserted: {total_inserted}")
-        except mysql.connector.Error as e:
-            print(f'Failed to insert data: {e}')
-            self.conn.rollback()
-        finally:
-            cursor.close()
-
-    def insert_users(self, users_data):
-        """Inserts user data using the generic batch insert method."""
-        if not users_data:
-            print("No data to insert.")
-            return
-
-        sql = """
-            INSERT INTO github_stars (
-                userid, name, stars, forks, language, html_url 
-            ) VALUES (%s, %s, %s, %s, %s, %s)
-        """
-        # Call the generic batch insert
-        self.batch_insert(sql, users_data)
-
-    def close(self):
-        if self.conn:
-            self.conn.close()
+import github_api
+import http_client
+import storage
+
+REPO_COLUMNS = ('userid', 'name', 'stars', 'forks', 'language', 'html_url')
+
+
+class Database(storage.Database):
+    def load_repos(self, repo_data):
+        """Atomically replaces github_stars with repo_data, keeping the old rows on failure."""
+        total_loaded = self.replace_rows('github_stars', REPO_COLUMNS, repo_data)
+        print(f"Total records loaded: {total_loaded}")
+        return total_loaded
 
 
 def fetch_repo_data(url, headers, params):
-    response = requests.get(url, headers=headers, params=params)
+    # Conditional request: a 304 is served from the local cache and doesn't count against the rate limit.
+    # github_api picks the token and waits out rate limits before retrying
+    response = github_api.request(http_client.get_session('github2'), 'GET', url,
+                                  headers=headers, params=params, cache=True)
     if response.status_code == 200:
         total_repos = response.json().get('items', [])
         repo_datas = [
@@ -105,11 +43,12 @@ def fetch_repo_data(url, headers, params):
 
 
 def get_top_repos(thread_count=5, total_pages=5):
-    token = github_token()
+    """Returns (repos, number of pages that failed)."""
     headers = {
         'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36',
-        'Authorization': f'token {token}'
+        # Authorization is added by github_api from the tokens in .env
     }
+    http_client.get_session('github2', pool_size=thread_count)
     base_url = "https://api.github.com/search/repositories"
     params = {
         'q': 'stars:>1',
@@ -119,6 +58,7 @@ def get_top_repos(thread_count=5, total_pages=5):
     }
 
     all_repos = []
+    failed_pages = 0
     # Set up thread pool and progress bar for each page fetch
     with ThreadPoolExecutor(max_workers=thread_count) as executor, tqdm(total=total_pages,
                                                                         desc="Fetching pages") as pbar:
@@ -130,23 +70,34 @@ def get_top_repos(thread_count=5, total_pages=5):
             page_repos = future.result()
             if page_repos:
                 all_repos.extend(page_repos)
+            else:
+                # Every page of the top-starred search is full; an empty one failed
+                failed_pages += 1
             pbar.update(1)
-    return all_repos
+    return all_repos, failed_pages
 
 
-if __name__ == '__main__':
+def main(thread_count=5, total_pages=10):
+    """Returns True when github_stars was replaced with the fetched repos."""
     # Connect to the database and insert data
     db = Database()
     db.connect()
+    if db.conn is None:
+        return False
 
-    # Clear existing data
-    db.clear_table()
+    try:
+        # Fetch top-starred repositories data with multithreading and progress bar
+        repo_data, failed_pages = get_top_repos(thread_count=thread_count, total_pages=total_pages)
+        if failed_pages:
+            print(f"{failed_pages} of {total_pages} pages failed, keeping the current github_stars table")
+            return False
 
-    # Fetch top-starred repositories data with multithreading and progress bar
-    repo_data = get_top_repos(thread_count=5, total_pages=10)
+        # Swap the fetched data in; readers keep seeing the old rows until then
+        return db.load_repos(repo_data) > 0
+    finally:
+        # Close the database connection
+        db.close()
 
-    # Insert fetched data into the database in batches
-    db.insert_users(repo_data)
 
-    # Close the database connection
-    db.close()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+Quota-aware scheduling for GitHub API requests.
+
+GitHub reports the quota left for every token in ``X-RateLimit-*`` response
+headers.  ``Scheduler`` tracks it per token and resource (core, search,
+graphql) for all worker threads: from the first response on, requests are
+spaced so the remaining quota is spread evenly over the time left until the
+reset; an exhausted quota pauses that token for every thread until exactly
+the reset; secondary rate limits back off by ``Retry-After`` or
+exponentially.  With several tokens in ``GITHUB_TOKENS`` each request goes to
+the token that may send soonest, so a crawl keeps going at the combined rate
+instead of failing halfway.
+"""
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from dotenv import load_dotenv
+
+import ratelimit
+
+# 二级限流没有 Retry-After 时的初始等待秒数，之后每次翻倍
+SECONDARY_BACKOFF = 60.0
+MAX_BACKOFF = 15 * 60.0
+# 在重置时间之后多等一会儿，抵消本地时钟误差
+RESET_SLACK = 1.0
+
+
+def load_tokens():
+    """
+    Tokens from ``GITHUB_TOKENS`` (comma separated) or ``GITHUB_TOKEN`` in ``.env``.
+    """
+    load_dotenv()
+    raw = os.getenv('GITHUB_TOKENS') or os.getenv('GITHUB_TOKEN') or ''
+    return [token.strip() for token in raw.split(',') if token.strip()]
+
+
+def resource_of(url):
+    path = urlsplit(url).path
+    if path.startswith('/search/'):
+        return 'search'
+    if path.startswith('/graphql'):
+        return 'graphql'
+    return 'core'
+
+
+class Quota:
+    """
+    Last known quota of one token for one resource.
+    """
+
+    def __init__(self):
+        self.limit = None
+        self.remaining = None
+        self.reset = 0.0  # epoch seconds
+        self.next_at = 0.0
+
+
+class Scheduler:
+    """
+    Picks a token for each request and keeps it within GitHub's rate limits.
+    """
+
+    def __init__(self, tokens=None):
+        tokens = load_tokens() if tokens is None else list(tokens)
+        # 没有令牌时以匿名身份请求，同样按响应头限速
+        self.tokens = tokens or [None]
+        self.quotas = {}
+        self.paused_until = {}
+        self.backoff = {}
+        self.lock = threading.Lock()
+
+    def _quota(self, token, resource):
+        quota = self.quotas.get((token, resource))
+        if quota is None:
+            quota = self.quotas[(token, resource)] = Quota()
+        return quota
+
+    def _ready_at(self, token, quota):
+        ready = max(quota.next_at, self.paused_until.get(token, 0.0))
+        if quota.remaining is not None and quota.remaining <= 0:
+            ready = max(ready, quota.reset + RESET_SLACK)
+        return ready
+
+    def acquire(self, resource='core'):
+        """
+        Blocks until some token may send a ``resource`` request; returns the token.
+        """
+        with self.lock:
+            now = time.time()
+            token = min(self.tokens, key=lambda t: self._ready_at(t, self._quota(t, resource)))
+            quota = self._quota(token, resource)
+            ready = self._ready_at(token, quota)
+            start = max(now, ready)
+            if quota.remaining is not None:
+                if quota.remaining <= 0:
+                    # 这次请求等到重置时间之后才发出，配额由它的响应头刷新；
+                    # 其他线程也要等到重置，不能因为 remaining 未知就立即发送
+                    quota.next_at = max(quota.next_at, quota.reset + RESET_SLACK)
+                    quota.remaining = None
+                else:
+                    quota.remaining -= 1
+                    # 剩余配额均匀分摊到重置前：每次请求之后间隔 (重置时间 - 现在) / 剩余次数
+                    quota.next_at = start + max(0.0, quota.reset - start) / (quota.remaining + 1)
+        if start > now:
+            time.sleep(start - now)
+        return token
+
+    def update(self, token, resource, response):
+        """
+        Records the quota headers of ``response``; returns True when it was throttled.
+        """
+        headers = response.headers
+        with self.lock:
+            quota = self._quota(token, headers.get('X-RateLimit-Resource', resource))
+            try:
+                if 'X-RateLimit-Remaining' in headers:
+                    quota.remaining = int(headers['X-RateLimit-Remaining'])
+                    quota.limit = int(headers.get('X-RateLimit-Limit', quota.limit or 0)) or None
+                    quota.reset = float(headers.get('X-RateLimit-Reset', quota.reset))
+            except ValueError:
+                pass
+
+            if response.status_code not in (403, 429):
+                self.backoff.pop(token, None)
+                return False
+            retry_after = ratelimit.parse_retry_after(headers)
+            if retry_after is None and quota.remaining == 0:
+                # 主配额用完：acquire 会一直等到重置时间
+                return True
+            if retry_after is None and response.status_code == 403 and 'rate limit' not in response.text.lower():
+                # 普通的权限错误，不是限流
+                return False
+            if retry_after is None:
+                retry_after = min(MAX_BACKOFF, self.backoff.get(token, SECONDARY_BACKOFF / 2) * 2)
+                self.backoff[token] = retry_after
+            self.paused_until[token] = max(self.paused_until.get(token, 0.0), time.time() + retry_after)
+            return True
+
+    def request(self, session, method, url, headers=None, retries=5, **kwargs):
+        """
+        Sends a request with the best available token, waiting out rate limits.
+        """
+        resource = resource_of(url)
+        response = None
+        for attempt in range(retries):
+            token = self.acquire(resource)
+            request_headers = dict(headers or {})
+            if token:
+                request_headers['Authorization'] = f'token {token}'
+            response = session.request(method, url, headers=request_headers, **kwargs)
+            # 从本地缓存返回的响应头是旧的，不能用来更新配额
+            if getattr(response, 'from_cache', False) or not self.update(token, resource, response):
+                return response
+            print(f"GitHub {resource} rate limit hit (attempt {attempt + 1}), waiting...")
+        return response
+
+
+_scheduler = None
+_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    Returns the scheduler shared by all GitHub spiders, loading tokens on first use.
+    """
+    global _scheduler
+    with _lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler
+
+
+def request(session, method, url, **kwargs):
+    return get_scheduler().request(session, method, url, **kwargs)
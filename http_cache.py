@@ -0,0 +1,95 @@
+"""
+Persistent conditional-request cache for repeat crawls.
+
+Responses that carry an ``ETag`` or ``Last-Modified`` header are stored on
+disk.  The next request for the same URL sends ``If-None-Match`` /
+``If-Modified-Since``; when the server answers ``304 Not Modified`` the stored
+body is served instead, so unchanged pages cost neither bandwidth nor (on
+GitHub) rate-limit quota.
+
+Entries are keyed by the URL plus the request headers the response depends
+on (``VARY_HEADERS``), so a body fetched with one GitHub token is never
+revalidated or served for another.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+from requests.structures import CaseInsensitiveDict
+
+CACHE_DIR = os.getenv('SPIDER_HTTP_CACHE', '.http_cache')
+
+# 这些响应头描述的是传输过程，缓存的正文已经解压，不能再带上它们
+_SKIP_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+
+# 响应内容随这些请求头变化（例如 GitHub 的令牌决定能看到哪些数据），计入缓存键
+VARY_HEADERS = ('Authorization', 'Accept')
+
+
+def _paths(url, request_headers=None):
+    key = url
+    if request_headers:
+        request_headers = CaseInsensitiveDict(request_headers)
+        for name in VARY_HEADERS:
+            if request_headers.get(name):
+                key += f'\n{name.lower()}: {request_headers[name]}'
+    key = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    folder = os.path.join(CACHE_DIR, key[:2])
+    return folder, os.path.join(folder, key + '.json'), os.path.join(folder, key + '.body')
+
+
+def _write_atomic(path, data):
+    folder = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def load(url, request_headers=None):
+    """
+    Returns ``(headers, body)`` stored for ``url`` requested with ``request_headers``, or None.
+    """
+    _, meta_path, body_path = _paths(url, request_headers)
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(body_path, 'rb') as f:
+            body = f.read()
+    except (OSError, ValueError):
+        return None
+    return CaseInsensitiveDict(meta['headers']), body
+
+
+def conditional_headers(url, request_headers=None):
+    """
+    Returns the validators to send for ``url`` (empty when nothing is cached).
+    """
+    _, meta_path, _ = _paths(url, request_headers)
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            headers = CaseInsensitiveDict(json.load(f)['headers'])
+    except (OSError, ValueError):
+        return {}
+    validators = {}
+    if headers.get('ETag'):
+        validators['If-None-Match'] = headers['ETag']
+    if headers.get('Last-Modified'):
+        validators['If-Modified-Since'] = headers['Last-Modified']
+    return validators
+
+
+def store(url, headers, body, request_headers=None):
+    """
+    Saves a 200 response if it carries a validator; returns whether it did.
+    """
+    if not (headers.get('ETag') or headers.get('Last-Modified')):
+        return False
+    folder, meta_path, body_path = _paths(url, request_headers)
+    os.makedirs(folder, exist_ok=True)
+    kept = {name: value for name, value in headers.items() if name.lower() not in _SKIP_HEADERS}
+    # 先写正文再写元数据，元数据存在就说明正文完整
+    _write_atomic(body_path, body)
+    _write_atomic(meta_path, json.dumps({'url': url, 'headers': kept}, ensure_ascii=False).encode('utf-8'))
+    return True
@@ -0,0 +1,144 @@
+"""
+Shared HTTP client for all spiders.
+
+Every spider gets a named keep-alive ``requests.Session`` whose per-host
+connection pool is sized to the spider's worker count, so repeated requests to
+the same host reuse sockets instead of paying a TCP/TLS handshake each time.
+All requests also pass through the shared per-host limiter in ``ratelimit``.
+GET requests made with ``cache=True`` are revalidated against ``http_cache``.
+"""
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+import http_cache
+import ratelimit
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
+
+# 每个 session 最多缓存多少个 host 的连接池
+POOL_CONNECTIONS = 16
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+class SpiderSession(requests.Session):
+    """
+    Session with default headers and a pool of ``pool_size`` sockets per host.
+    """
+
+    def __init__(self, pool_size=10):
+        super().__init__()
+        self.headers.update(DEFAULT_HEADERS)
+        self.pool_size = 0
+        self.resize(pool_size)
+
+    def resize(self, pool_size):
+        """
+        Grows the per-host pools so that ``pool_size`` workers never block.
+        """
+        if pool_size <= self.pool_size:
+            return
+        old_adapter = self.adapters.get('https://')
+        adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+        if old_adapter is not None:
+            old_adapter.close()
+        self.pool_size = pool_size
+
+    def request(self, method, url, *args, cache=False, **kwargs):
+        if cache and method.upper() == 'GET':
+            return self._cached_get(url, **kwargs)
+        return self._limited_request(method, url, *args, **kwargs)
+
+    def _cached_get(self, url, params=None, headers=None, **kwargs):
+        """
+        Conditional GET; a 304 is answered from the on-disk cache as a 200.
+        """
+        full_url = requests.Request('GET', url, params=params).prepare().url
+        # 缓存键包含实际发出的 Authorization/Accept（会话默认头加上本次请求的头）
+        request_headers = CaseInsensitiveDict(self.headers)
+        request_headers.update(headers or {})
+        headers = {**(headers or {}), **http_cache.conditional_headers(full_url, request_headers)}
+        response = self._limited_request('GET', full_url, headers=headers, **kwargs)
+
+        if response.status_code == 200:
+            http_cache.store(full_url, response.headers, response.content, request_headers)
+        elif response.status_code == 304:
+            cached = http_cache.load(full_url, request_headers)
+            if cached is not None:
+                cached_response = requests.Response()
+                cached_response.status_code = 200
+                cached_response.headers, cached_response._content = cached
+                cached_response.url = full_url
+                cached_response.request = response.request
+                cached_response.from_cache = True
+                return cached_response
+        return response
+
+    def _limited_request(self, method, url, *args, **kwargs):
+        limiter = ratelimit.get_limiter(url)
+        limiter.acquire()
+        start = time.monotonic()
+        status = retry_after = None
+        try:
+            response = super().request(method, url, *args, **kwargs)
+            status = response.status_code
+            retry_after = ratelimit.parse_retry_after(response.headers)
+            if kwargs.get('stream'):
+                # 流式下载在读完响应体之前一直占着该 host 的并发名额；
+                # 延迟只算到响应头到达为止，大文件的传输时间不算慢响应
+                elapsed = time.monotonic() - start
+                self._release_on_close(response, limiter, status, elapsed, retry_after)
+                limiter = None
+            return response
+        finally:
+            if limiter is not None:
+                limiter.release(status, time.monotonic() - start, retry_after=retry_after)
+
+    @staticmethod
+    def _release_on_close(response, limiter, status, elapsed, retry_after):
+        close = response.close
+        released = []
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                if not released:
+                    released.append(True)
+                    limiter.release(status, elapsed, retry_after=retry_after)
+
+        response.close = close_and_release
+
+
+def get_session(name, pool_size=10):
+    """
+    Returns the shared session for spider ``name``, creating it on first use.
+    """
+    with _lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = _sessions[name] = SpiderSession(pool_size)
+        else:
+            session.resize(pool_size)
+        return session
+
+
+def close_all():
+    """
+    Closes every shared session and its pooled connections.
+    """
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,135 @@
+"""
+Content-addressed image store with download deduplication.
+
+Images are saved as ``<root>/<aa>/<sha256><ext>``, and a small SQLite index
+maps each source URL to its hash and size.  Spiders check :meth:`ImageStore.has`
+before fetching, so re-running over the same galleries costs one lookup per
+image instead of a full download.
+"""
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from urllib.parse import urlsplit
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def url_extension(url, default='.jpg'):
+    """
+    Extension of the file named by ``url`` (ignoring suffixes like ``!lrg``).
+    """
+    name = urlsplit(url).path.rsplit('/', 1)[-1].split('!', 1)[0]
+    ext = os.path.splitext(name)[1].lower()
+    return ext if ext and len(ext) <= 6 else default
+
+
+class ImageStore:
+    """
+    Hash-named image files under ``root`` plus a URL -> (hash, size) index.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(root, 'index.sqlite'), check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS images ("
+            " url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, size INTEGER NOT NULL, ext TEXT NOT NULL)")
+        self.db.commit()
+
+    def object_path(self, sha256, ext):
+        return os.path.join(self.root, sha256[:2], sha256 + ext)
+
+    def lookup(self, url):
+        """
+        Returns ``(sha256, size, path)`` for an already stored URL, or None.
+        """
+        with self.lock:
+            row = self.db.execute("SELECT sha256, size, ext FROM images WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        sha256, size, ext = row
+        path = self.object_path(sha256, ext)
+        # 索引还在但文件被删掉时当作未下载
+        if not os.path.exists(path):
+            return None
+        return sha256, size, path
+
+    def has(self, url):
+        return self.lookup(url) is not None
+
+    def put_file(self, url, file_path, ext=None):
+        """
+        Moves a downloaded file into the store and indexes it; returns its path.
+        """
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        sha256 = digest.hexdigest()
+        ext = ext or url_extension(url)
+        path = self.object_path(sha256, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            # 内容相同的图片只保存一份
+            os.remove(file_path)
+        else:
+            os.replace(file_path, path)
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO images (url, sha256, size, ext) VALUES (?, ?, ?, ?)",
+                            (url, sha256, os.path.getsize(path), ext))
+            self.db.commit()
+        return path
+
+    def download_path(self, url):
+        """
+        Stable temporary path for downloading ``url``, so partial files survive restarts.
+        """
+        return os.path.join(self.tmp_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.img')
+
+    def put_chunks(self, url, chunks, ext=None):
+        """
+        Writes an iterable of byte chunks into the store; returns the stored path.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return self.put_file(url, tmp_path, ext)
+
+    def put_bytes(self, url, data, ext=None):
+        return self.put_chunks(url, [data], ext)
+
+    def link(self, path, dest):
+        """
+        Exposes a stored object under a readable name (hard link, or copy).
+        """
+        if os.path.exists(dest):
+            return dest
+        os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+        try:
+            os.link(path, dest)
+        except OSError:
+            shutil.copyfile(path, dest)
+        return dest
+
+
+def get_store(root):
+    """
+    Returns the shared store rooted at ``root``, opening it on first use.
+    """
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None:
+            store = _stores[root] = ImageStore(root)
+        return store
@@ -1,96 +1,156 @@
+"""
+JD product comments: crawl, aggregate and chart.
+
+    python jd.py crawl [--url URL]        # 只爬取评论并写入数据库
+    python jd.py crawl --resume           # 从上次中断的地方继续爬取
+    python jd.py aggregate                # 在数据库中统计字段频次并分词，结果写入 data/jd_aggregates.json
+    python jd.py render [--backend svg]   # 根据统计结果输出图表
+    python jd.py prepare                  # 预先构建 jieba 词典缓存
+    python jd.py                          # 依次执行 crawl、aggregate、render
+
+Each subcommand imports only what it needs: pyecharts, Selenium and jieba
+are loaded inside the functions that use them, so a crawl-only run doesn't
+pay for the chart and tokenizer stack.
+"""
+import argparse
 import json
 import os
 from collections import Counter
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections.abc import Mapping
 
-import jieba
-import mysql.connector
 import requests
-from pyecharts import options as opts
-from pyecharts.charts import Bar, WordCloud
-from pyecharts.globals import ThemeType
-from pyecharts.render import make_snapshot
-from snapshot_selenium import snapshot
 from tqdm import tqdm
 
-db_config = {
-    'host': '106.15.79.229',
-    'port': 3306,
-    'user': 'root',
-    'password': '910920',
-    'database': 'demo'
-}
+import checkpoint
+import http_client
+import jsonp
+import pagination
+import pipeline
+import ratelimit
+import storage
 
+COMMENT_COLUMNS = ('userid', 'creation_time', 'content', 'score', 'product_color', 'product_size',
+                   'buy_count', 'location', 'mobile_version')
+# 连续这么多页没有评论就认为已经到底
+EMPTY_PAGES_TO_STOP = 3
 
-class Database:
-    def __init__(self):
-        self.conn = None
 
-    def connect(self):
-        try:
-            self.conn = mysql.connector.connect(**db_config)
-        except mysql.connector.Error as e:
-            print(f'连接数据库失败：{e}')
+class Database(storage.Database):
+    def comments_loader(self, resume=False):
+        """
+        Staging loader for the comments table.
+
+        Comments go into a shadow table that replaces ``comments`` atomically
+        once the crawl finishes; if it fails, the old comments stay in place
+        and the shadow table is kept for ``resume``.
+        """
+        return self.staging_load('comments', COMMENT_COLUMNS, resume=resume, keep_on_error=True)
 
-    def clear_comments_table(self):
+    def column_counts(self, columns):
+        """
+        Frequency counts of several comment columns, computed by the database.
+
+        Each column gets its own ``GROUP BY`` (one table scan per column); the
+        statements are joined with ``UNION ALL`` so they are sent in one round
+        trip, and only the aggregated ``{column: {value: count}}`` reaches
+        Python.  Empty values (NULL or '') are skipped.
+        """
+        unknown = set(columns) - set(COMMENT_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown comment columns: {', '.join(sorted(unknown))}")
+        sql = ' UNION ALL '.join(
+            f"SELECT '{column}', {column}, COUNT(*) FROM comments"
+            f" WHERE {column} IS NOT NULL AND {column} <> '' GROUP BY {column}"
+            for column in columns)
+        counts = {column: Counter() for column in columns}
         cursor = self.conn.cursor()
         try:
-            cursor.execute("TRUNCATE TABLE comments;")
-            print('数据已清除!!!')
-            self.conn.commit()
-        except mysql.connector.Error as e:
-            print(f'清空表数据失败：{e}')
+            cursor.execute(sql)
+            for column, value, count in cursor:
+                counts[column][value] = count
         finally:
             cursor.close()
+        return counts
 
-    def insert_comments(self, comments_data):
-        if not comments_data:
-            return
-
-        cursor = self.conn.cursor()
-        sql = """
-            INSERT INTO comments (userid, creation_time, content, score, product_color, product_size, buy_count, location, mobile_version)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    def iter_comment_texts(self, batch_size=1000):
+        """
+        Yields ``(comment id, content)`` pairs without loading the whole table at once.
         """
+        cursor = self.conn.cursor()
         try:
-            cursor.executemany(sql, comments_data)
-            self.conn.commit()
-            print(f'成功插入 {len(comments_data)} 条评论')
-        except mysql.connector.Error as e:
-            print(f'批量插入数据失败：{e}')
-            self.conn.rollback()
+            cursor.execute("SELECT userid, content FROM comments")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
         finally:
             cursor.close()
 
-    def fetch_column_data(self, column_name):
-        cursor = self.conn.cursor()
-        sql = f"SELECT {column_name} FROM comments"
-        cursor.execute(sql)
-        result = cursor.fetchall()
-        cursor.close()
-        return [item[0] for item in result if item[0]]  # 排除空值
-
-    def close(self):
-        if self.conn:
-            self.conn.close()
 
 
-def fetch_comments_page(product_id, page, headers):
-    comment_url = f'https://club.jd.com/comment/productPageComments.action?callback=fetchJSON_comment98&productId={
-        product_id}&score=0&sortType=5&page={page}&pageSize=10&isShadowSku=0&fold=1'
+def fetch_comments_data(product_id, page, headers):
+    """
+    Fetches one comment page; returns ``(rows, max_page, summary)`` or None on failure.
+    """
+    comment_url = ('https://club.jd.com/comment/productPageComments.action?callback=fetchJSON_comment98'
+                   f'&productId={product_id}&score=0&sortType=5&page={page}&pageSize=10&isShadowSku=0&fold=1')
     try:
-        response = requests.get(comment_url, headers=headers)
+        response = http_client.get_session('jd').get(comment_url, headers=headers)
         response.raise_for_status()
-        comment_json = response.text.replace(
-            'fetchJSON_comment98(', '').replace(');', '')
-        comment_data = json.loads(comment_json)
-        return comment_data['comments']
-    except (requests.RequestException, json.JSONDecodeError) as e:
+        return decode_comments_page(response.text)
+    except json.JSONDecodeError as e:
+        # 返回的不是 JSONP，通常是验证页，通知限流器减速
+        ratelimit.report_blocked(comment_url)
         print(f'页面 {page} 获取失败：{e}')
-        return []
-
-
-def get_comments_multithread(product_url):
+        return None
+    except requests.RequestException as e:
+        print(f'页面 {page} 获取失败：{e}')
+        return None
+
+
+def decode_comments_page(text):
+    """
+    Decodes a JSONP comment page into ``(rows, max_page, summary)``.
+
+    Only the fields needed for the comments table and page scheduling are
+    kept; the rest of the decoded document is dropped right away.
+    """
+    comment_data = jsonp.loads(text)
+    if not isinstance(comment_data, dict):
+        raise json.JSONDecodeError('unexpected comment payload', text[:100], 0)
+    rows = [comment_row(comment) for comment in comment_data.get('comments') or []]
+    return rows, comment_data.get('maxPage'), comment_data.get('productCommentSummary') or {}
+
+
+def comment_row(comment):
+    """
+    Converts one comment from the API into a row for the comments table.
+    """
+    return (
+        comment.get('id'),
+        comment.get('creationTime'),
+        comment.get('content'),
+        comment.get('score'),
+        comment.get('productColor'),
+        comment.get('productSize'),
+        (comment.get('extMap') or {}).get('buyCount'),
+        comment.get('location'),
+        comment.get('mobileVersion'),
+    )
+
+
+def get_comments_multithread(product_url, thread_count=8, resume=False):
+    """
+    Crawls all comment pages of a product into the comments table.
+
+    Finished pages are recorded in a checkpoint once their rows are
+    committed to the shadow table; with ``resume`` a crawl that died
+    halfway continues from there and fetches only the missing pages.  If a
+    page still fails after its retries, the shadow table is kept instead of
+    being swapped in with a hole, so ``resume`` can fill in just that page.
+    Returns True when the comments table was replaced with the new data.
+    """
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
     }
@@ -98,51 +158,108 @@ def get_comments_multithread(product_url):
     database = Database()
     database.connect()
     if database.conn is None:
-        return
-
-    database.clear_comments_table()
+        return False
 
+    # 接口最多返回 100 页；实际页数从第一页的 maxPage 读取
     max_pages = 100
-    thread_count = 2
-    all_comments = []
-
-    with ThreadPoolExecutor(max_workers=thread_count) as executor:
-        futures = {executor.submit(
-            fetch_comments_page, product_id, page, headers): page for page in range(max_pages)}
-        for future in tqdm(as_completed(futures), total=len(futures), desc="爬取评论"):
-            page_comments = future.result()
-            if page_comments:
-                all_comments.extend([
-                    (
-                        comment.get('id'),
-                        comment.get('creationTime'),
-                        comment.get('content'),
-                        comment.get('score'),
-                        comment.get('productColor'),
-                        comment.get('productSize'),
-                        comment['extMap'].get('buyCount'),
-                        comment.get('location'),
-                        comment.get('mobileVersion'),
-                    )
-                    for comment in page_comments
-                ])
-
-    print(f'共爬取到 {len(all_comments)} 条评论')
-    batch_size = 200
-    for i in range(0, len(all_comments), batch_size):
-        database.insert_comments(all_comments[i:i + batch_size])
-
-    database.close()
-
-
-# 生成并保存柱状图
-def generate_bar_chart(data, title, filename):
-    # 统计词频
-    counter = Counter(data)
+    # 线程数只是上限，实际并发由 ratelimit 根据响应情况自适应调整
+    http_client.get_session('jd', pool_size=thread_count)
+
+    # comments__staging 只有一张，记录它正在为哪个商品收集评论；不是同一个商品时不能续爬
+    owners = checkpoint.Checkpoint('jd', resume=True)
+    owner = owners.output('staging', 'comments')
+    if resume and owner is not None and owner != product_id:
+        print(f'影子表中是商品 {owner} 的评论，不能用来续爬商品 {product_id}，请去掉 --resume 重新爬取')
+        owners.close()
+        database.close()
+        return False
+
+    state = checkpoint.Checkpoint(f'jd:{product_id}', resume=resume)
+    # 没有任何已完成的页时影子表里的数据无从对应，重新建表，避免重复写入
+    resume = resume and bool(state.done('page'))
+    summary = {}
+
+    def fetch_page(page):
+        comment_data = fetch_comments_data(product_id, page, headers)
+        if comment_data is None:
+            # 失败的页由 pagination 重试，不当作空页
+            return None
+        rows, max_page, page_summary = comment_data
+        if page == 0:
+            summary.update(page_summary)
+            summary['maxPage'] = min(max_page or max_pages, max_pages)
+            state.mark_done('meta', 'maxPage', summary['maxPage'])
+            print(f"评论总数 {summary.get('commentCount')}，共 {summary['maxPage']} 页")
+        return rows, summary.get('maxPage', max_pages) - 1
+
+    # 每批页面的评论先提交到影子表，再记为已完成；中断后最多重爬最后一批未提交的页
+    def write_pages(pages):
+        loader.add(row for _, rows in pages for row in rows)
+        loader.commit()
+        state.mark_many('page', [(page, len(rows)) for page, rows in pages])
+        return sum(len(rows) for _, rows in pages)
+
+    # 评论边爬取边由写入线程写入影子表，整个爬取成功后再替换 comments 表；
+    # 只调度实际存在的页，连续遇到空页就不再继续
+    try:
+        with database.comments_loader(resume) as loader:
+            if not loader.resumed:
+                # 影子表不在了（上次已经完成或者从未写入），断点记录作废，从头爬取
+                state.clear()
+            owners.mark_done('staging', 'comments', product_id)
+            done_pages = {int(page) for page in state.done('page')}
+            if done_pages:
+                summary['maxPage'] = state.output('meta', 'maxPage')
+                print(f'从断点继续：{len(done_pages)} 页已完成，影子表中已有 {loader.total} 条评论')
+            last_page = summary['maxPage'] - 1 if summary.get('maxPage') else None
+
+            failed_pages = set()
+            with pipeline.RowPipeline(write_pages, batch_size=20) as comments_pipeline, \
+                    tqdm(desc="爬取评论", unit="页", initial=len(done_pages)) as pbar:
+                pages = pagination.discover(fetch_page, first_page=0, last_page=last_page,
+                                            max_workers=thread_count, stop_after_empty=EMPTY_PAGES_TO_STOP,
+                                            skip=done_pages, failed=failed_pages)
+                for page, rows in pages:
+                    pbar.total = summary.get('maxPage')
+                    pbar.update(1)
+                    comments_pipeline.put([(page, rows)])
+            if failed_pages:
+                # 已完成的页都已提交到影子表并记录在断点中，续爬时只补这几页
+                loader.abort(f'第 {sorted(failed_pages)} 页评论获取失败，影子表已保留，可用 crawl --resume 补爬')
+        if loader.aborted:
+            print(f'共写入 {loader.total} 条评论')
+            return False
+        # 影子表已经换入或删除，不再属于任何商品
+        owners.clear()
+        print(f'共写入 {loader.total} 条评论')
+        return loader.swapped
+    except storage.DB_ERRORS as e:
+        print(f'批量插入数据失败：{e}')
+        return False
+    finally:
+        state.close()
+        owners.close()
+        database.close()
+
+
+OUTPUT_DIR = "data"
+
+
+def bar_chart(data, title):
+    """
+    Builds the bar chart for one column (raw values or ``{value: count}``).
+    """
+    from pyecharts import options as opts
+    from pyecharts.charts import Bar
+    from pyecharts.globals import ThemeType
+
+    # data 可以是原始取值列表，也可以是 column_counts 已经统计好的 {取值: 次数}
+    counter = data if isinstance(data, Mapping) else Counter(data)
     labels, values = zip(*counter.items())
 
-    # 创建柱状图
-    bar = Bar(init_opts=opts.InitOpts(bg_color="white", theme=ThemeType.LIGHT))
+    # 创建柱状图；关闭动画，截图时不用等动画播放完
+    bar = Bar(init_opts=opts.InitOpts(bg_color="white", theme=ThemeType.LIGHT,
+                                      animation_opts=opts.AnimationOpts(animation=False)))
     bar.add_xaxis(list(labels))
     bar.add_yaxis(title, list(values),
                   itemstyle_opts=opts.ItemStyleOpts(color="auto"))
@@ -157,90 +274,171 @@ def generate_bar_chart(data, title, filename):
             title_opts=opts.TitleOpts(title=title),
             visualmap_opts=opts.VisualMapOpts(is_show=False, max_=max(values))
         )
-    # 检查并创建data目录
-    output_dir = "data"
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    # 保存柱状图为图片
-    filepath = os.path.join(output_dir, filename)
-    temp_html_path = "temp.html"  # 临时 HTML 文件路径
-    bar.render(temp_html_path)  # 先渲染为临时 HTML
-    # 使用 snapshot 将 HTML 转换为图片
-    make_snapshot(snapshot, temp_html_path, filepath)
-
-    # 删除临时 HTML 文件
-    if os.path.exists(temp_html_path):
-        os.remove(temp_html_path)
-        print(f"已删除临时文件: {temp_html_path}")
+    return bar
 
-    print(f"{filename} 柱状图已保存到: {filepath}")
 
+def word_cloud_chart(word_counts):
+    """
+    Builds the comment word cloud from ``wordfreq.word_counts`` output.
+    """
+    from pyecharts import options as opts
+    from pyecharts.charts import WordCloud
 
-def generate_word_cloud(texts, filename):
-    # 将评论文本分词
-    all_words = []
-    for text in texts:
-        all_words.extend(jieba.lcut(text))
-
-    # 统计词频
-    counter = Counter(all_words)
-    words, counts = zip(*counter.most_common(1000))  # 只取前1000个词
+    # word_counts 是 wordfreq.word_counts 统计好的词频（已去掉停用词）
+    words, counts = zip(*Counter(word_counts).most_common(1000))  # 只取前1000个词
 
     # 创建词云
-    wordcloud = WordCloud()
+    wordcloud = WordCloud(init_opts=opts.InitOpts(animation_opts=opts.AnimationOpts(animation=False)))
     wordcloud.add("", [list(z)
                   for z in zip(words, counts)], word_size_range=[20, 100])
     wordcloud.set_global_opts(
         title_opts=opts.TitleOpts(title="Comments WordCloud"))
+    return wordcloud
 
-    # 检查并创建 data 目录
-    output_dir = "data"
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
 
-    # 将词云渲染为 PNG 图片
-    filepath = os.path.join(output_dir, filename)
-    temp_html_path = "render.html"  # 临时 HTML 文件路径
-    wordcloud.render(temp_html_path)  # 渲染为临时 HTML
-    # 使用 snapshot 将 HTML 转换为图片
-    make_snapshot(snapshot, temp_html_path, filepath)
+# 图表输出方式：browser 用 pyecharts + 浏览器截图；svg/png 不需要浏览器，在进程内直接绘制
+CHART_BACKEND = os.getenv('JD_CHART_BACKEND', 'browser')
+CHART_BACKENDS = ('browser', 'svg', 'png')
 
-    # 删除临时 HTML 文件
-    if os.path.exists(temp_html_path):
-        os.remove(temp_html_path)
-        print(f"已删除临时文件: {temp_html_path}")
 
-    print(f"{filename} 词云已保存到: {filepath}")
+def render_charts(specs, backend=None, pool=None):
+    """
+    Saves charts under OUTPUT_DIR and returns their paths.
 
+    ``specs`` are ``(kind, counts, title, filename)`` tuples with kind 'bar'
+    or 'wordcloud'.  The browser backend snapshots all pyecharts charts in one
+    concurrent batch, using ``pool`` (a chart_render.BrowserPool) or a
+    temporary pool.  The svg and png backends draw in-process with
+    chart_static; the file extension is changed to match.
+    """
+    backend = backend or CHART_BACKEND
+    if backend not in CHART_BACKENDS:
+        raise ValueError(f"Unknown chart backend: {backend}")
 
-if __name__ == '__main__':
-    url = 'https://item.jd.com/100004972871.html'
-    get_comments_multithread(url)
+    if backend == 'browser':
+        import chart_render
+
+        jobs = [(bar_chart(counts, title) if kind == 'bar' else word_cloud_chart(counts),
+                 os.path.join(OUTPUT_DIR, filename))
+                for kind, counts, title, filename in specs]
+        paths = chart_render.render_all(jobs, pool=pool)
+    else:
+        import chart_static
+
+        paths = []
+        for kind, counts, title, filename in specs:
+            path = os.path.join(OUTPUT_DIR, os.path.splitext(filename)[0] + '.' + backend)
+            if kind == 'bar':
+                paths.append(chart_static.save_bar(counts, title, path))
+            else:
+                paths.append(chart_static.save_word_cloud(counts, path))
+    for path in paths:
+        print(f"图表已保存到: {path}")
+    return paths
+
+
+AGGREGATES_FILE = os.path.join(OUTPUT_DIR, 'jd_aggregates.json')
+PRODUCT_URL = 'https://item.jd.com/100004972871.html'
+# (字段, 图表标题, 文件名)
+BAR_CHARTS = (
+    ("product_color", "Product Colors", "product_colors_bar.png"),
+    ("product_size", "Product Size ", "product_size_bar.png"),
+    ("location", "Location ", "location_bar.png"),
+    ("buy_count", "Buy_Count ", "buy_count_bar.png"),
+)
+WORD_CLOUD_FILE = "comments_wordcloud.png"
+
+
+def aggregate(path=AGGREGATES_FILE):
+    """
+    Counts the chart columns in the database and tokenizes the comments; saves the result as JSON.
+    """
+    import wordfreq
 
     db = Database()
     db.connect()
     if db.conn is None:
-        exit()
-
-    # 生成 product_color 的柱状图并保存为图片
-    product_colors = db.fetch_column_data("product_color")
-    generate_bar_chart(product_colors, "Product Colors",
-                       "product_colors_bar.png")
-
-    # 生成 product_size 的柱状图并保存为图片
-    product_size = db.fetch_column_data("product_size")
-    generate_bar_chart(product_size, "Product Size ", "product_size_bar.png")
-
-    # 生成 location 的柱状图并保存为图片
-    location = db.fetch_column_data("location")
-    generate_bar_chart(location, "Location ", "location_bar.png")
+        return None
+    try:
+        # 四个字段的频次在数据库里一次聚合完成，不再把整列取回 Python
+        column_counts = db.column_counts([column for column, _, _ in BAR_CHARTS])
+        # 评论内容的词频：多进程分词，按评论 id 缓存，只对新评论分词
+        word_counts = wordfreq.word_counts(db.iter_comment_texts())
+    finally:
+        db.close()
+
+    aggregates = {
+        'columns': {column: {str(value): count for value, count in counts.items()}
+                    for column, counts in column_counts.items()},
+        'words': dict(word_counts.most_common(1000)),
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(aggregates, f, ensure_ascii=False)
+    print(f"统计结果已保存到: {path}")
+    return aggregates
+
+
+def render(path=AGGREGATES_FILE, backend=None):
+    """
+    Draws all charts from the saved aggregates.
+    """
+    with open(path, encoding='utf-8') as f:
+        aggregates = json.load(f)
+    # 四张柱状图和词云一起输出；browser 后端用常驻的浏览器池并发截图，svg/png 不启动浏览器
+    specs = [('bar', Counter(aggregates['columns'][column]), title, filename)
+             for column, title, filename in BAR_CHARTS]
+    specs.append(('wordcloud', aggregates['words'], None, WORD_CLOUD_FILE))
+    return render_charts(specs, backend)
+
+
+def run_all(product_url=PRODUCT_URL, thread_count=8, backend=None):
+    """
+    Crawl, aggregate and render in one go (the behaviour without a subcommand).
+
+    Returns True when all three steps succeeded.  Charts are still drawn from
+    the existing comments if the crawl failed.
+    """
+    crawled = get_comments_multithread(product_url, thread_count)
+    if aggregate() is None:
+        return False
+    render(backend=backend)
+    return crawled
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JD 商品评论爬取与分析")
+    subparsers = parser.add_subparsers(dest='command')
+
+    crawl_parser = subparsers.add_parser('crawl', help='爬取评论并写入数据库')
+    crawl_parser.add_argument('--url', default=PRODUCT_URL, help='商品页 URL')
+    crawl_parser.add_argument('--resume', action='store_true', help='只爬取上次中断时未完成的页')
+
+    aggregate_parser = subparsers.add_parser('aggregate', help='统计字段频次和评论词频')
+    aggregate_parser.add_argument('--output', default=AGGREGATES_FILE)
+
+    render_parser = subparsers.add_parser('render', help='根据统计结果输出图表')
+    render_parser.add_argument('--input', default=AGGREGATES_FILE)
+    render_parser.add_argument('--backend', choices=CHART_BACKENDS, default=None,
+                               help='图表输出方式，默认取 JD_CHART_BACKEND 或 browser')
+
+    subparsers.add_parser('prepare', help='预先构建 jieba 词典缓存')
+
+    args = parser.parse_args(argv)
+    if args.command == 'crawl':
+        get_comments_multithread(args.url, resume=args.resume)
+    elif args.command == 'aggregate':
+        aggregate(args.output)
+    elif args.command == 'render':
+        render(args.input, args.backend)
+    elif args.command == 'prepare':
+        import wordfreq
+
+        wordfreq.load_dictionary()
+        print(f"jieba 词典缓存: {os.path.abspath(wordfreq.JIEBA_CACHE)}")
+    else:
+        run_all()
 
-    # 生成 buy_count 的柱状图并保存为图片
-    buy_count = db.fetch_column_data("buy_count")
-    generate_bar_chart(buy_count, "Buy_Count ", "buy_count_bar.png")
 
-    # 生成评论内容的词云，并保存为 PNG 格式
-    comments = db.fetch_column_data("content")
-    generate_word_cloud(comments, "comments_wordcloud.png")
-    db.close()
+if __name__ == '__main__':
+    main()
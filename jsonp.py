@@ -0,0 +1,51 @@
+"""
+JSONP decoding helpers.
+
+``payload`` slices the JSON out of ``callback(...)`` by locating the wrapper
+boundaries once, instead of running replace passes over the whole body (which
+also strips ``);`` from inside string values).  ``loads`` decodes it with
+orjson when it is installed, otherwise with the stdlib ``json`` module.
+Both backends raise ``json.JSONDecodeError`` on bad input.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+_loads = orjson.loads if orjson is not None else json.loads
+
+
+def set_backend(name):
+    """
+    Switches the decoder used by ``loads`` ('orjson' or 'json').
+    """
+    global BACKEND, _loads
+    if name == 'orjson' and orjson is None:
+        raise ValueError("orjson is not installed")
+    BACKEND = name
+    _loads = orjson.loads if name == 'orjson' else json.loads
+
+
+def payload(text):
+    """
+    Returns the JSON text inside ``callback(...)``; plain JSON is returned as is.
+    """
+    start = text.find('(')
+    end = text.rfind(')')
+    if start == -1 or end < start:
+        return text
+    # 回调名只能是标识符（可带点号），否则说明 ( 是 JSON 内容的一部分
+    callback = text[:start].strip()
+    if not callback.replace('.', '_').isidentifier():
+        return text
+    return text[start + 1:end]
+
+
+def loads(text):
+    """
+    Decodes a JSONP (or plain JSON) body.
+    """
+    return _loads(payload(text))
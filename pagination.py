@@ -0,0 +1,170 @@
+"""
+Listing-page discovery with last-page detection and early stop.
+
+``discover`` fetches the first listing page, reads the last page number from
+it (or probes when the page doesn't say), then fetches the remaining pages
+concurrently and yields their items as soon as each page arrives, so the
+caller can start downloading while discovery is still running.  Nothing past
+the first empty page (or run of empty pages) is scheduled; a page whose
+request failed is retried, never taken for the end of the list.
+"""
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# 分页容器常见的 class，例如 paging / paginator / pagination
+PAGINATION_CLASS = re.compile(r'pag', re.I)
+
+
+def last_page_number(soup, href_pattern=None):
+    """
+    Returns the largest page number linked from the page's pagination, or None.
+
+    With ``href_pattern`` (a regex whose first group is the page number) all
+    links are checked by URL; otherwise the numeric link texts inside
+    pagination containers are used.
+    """
+    numbers = []
+    if href_pattern is not None:
+        pattern = re.compile(href_pattern)
+        for link in soup.find_all('a', href=True):
+            match = pattern.search(link['href'])
+            if match:
+                numbers.append(int(match.group(1)))
+    else:
+        for container in soup.find_all(class_=PAGINATION_CLASS):
+            for link in container.find_all('a'):
+                text = link.get_text(strip=True)
+                if text.isdigit():
+                    numbers.append(int(text))
+    return max(numbers) if numbers else None
+
+
+def last_page_in_text(text, pattern):
+    """
+    Largest number captured by ``pattern`` in raw markup, or None.
+
+    Cheaper than building a soup when only the page links are needed.
+    """
+    numbers = [int(n) for n in re.findall(pattern, text)]
+    return max(numbers) if numbers else None
+
+
+def _fetch(fetch_page, page):
+    try:
+        return fetch_page(page)
+    except Exception as e:
+        # 单个列表页失败不应中断整个发现过程
+        print(f"Failed to fetch listing page {page}: {e}")
+        return None
+
+
+def _run(pages, page):
+    # pages 中包含 page 的连续页码区间
+    start = end = page
+    while start - 1 in pages:
+        start -= 1
+    while end + 1 in pages:
+        end += 1
+    return start, end
+
+
+def discover(fetch_page, first_page=1, last_page=None, max_workers=8, stop_after_empty=1, skip=(),
+             retries=2, failed=None):
+    """
+    Yields ``(page, items)`` for every non-empty listing page.
+
+    ``fetch_page(page)`` returns ``(items, last_page_hint)``, or None when the
+    request failed; the hint of the first page (or ``last_page`` when given)
+    bounds the crawl.  Without either, pages are probed ``max_workers`` at a
+    time.  Scheduling stops after ``stop_after_empty`` consecutive empty
+    pages.  Pages are yielded in completion order, not page order.
+
+    A page that fails (or raises) is fetched again up to ``retries`` times.
+    Failed pages never count as empty; the ones that still fail are logged
+    and added to ``failed`` (when given) once discovery is over.  Without a
+    known last page, probing gives up after ``max_workers`` consecutive failed
+    pages, since the end of the list can't be told apart from an outage.
+
+    Pages in ``skip`` (e.g. finished in an earlier run) are neither fetched
+    nor yielded and count as non-empty.  When the first page is skipped,
+    pass ``last_page``; otherwise the remaining pages are probed.
+    """
+    skip = set(skip)
+    failed = set() if failed is None else failed
+    hint = None
+    if first_page not in skip:
+        for _ in range(retries + 1):
+            result = _fetch(fetch_page, first_page)
+            if result is not None:
+                break
+        if result is None:
+            # 首页都取不到时无从知道有多少页
+            print(f"Giving up on listing page {first_page} after {retries + 1} attempts")
+            failed.add(first_page)
+            return
+        items, hint = result
+        if not items:
+            return
+        yield first_page, items
+
+    last_page = last_page or hint
+    empty_pages = set()
+    given_up = set()
+    attempts = {}
+    retry = []
+    stop_at = None
+    probing = True
+    next_page = first_page + 1
+    pending = {}
+
+    def can_schedule():
+        if last_page is not None and next_page > last_page:
+            return False
+        return probing and (stop_at is None or next_page < stop_at)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            while len(pending) < max_workers and (retry or can_schedule()):
+                if retry:
+                    page = retry.pop()
+                    if stop_at is not None and page >= stop_at:
+                        continue
+                elif next_page in skip:
+                    next_page += 1
+                    continue
+                else:
+                    page = next_page
+                    next_page += 1
+                pending[executor.submit(_fetch, fetch_page, page)] = page
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                page = pending.pop(future)
+                result = future.result()
+                if result is None:
+                    if stop_at is not None and page >= stop_at:
+                        continue
+                    attempts[page] = attempts.get(page, 0) + 1
+                    if attempts[page] <= retries:
+                        retry.append(page)
+                        continue
+                    print(f"Giving up on listing page {page} after {retries + 1} attempts")
+                    given_up.add(page)
+                    run_start, run_end = _run(given_up, page)
+                    if last_page is None and probing and run_end - run_start + 1 >= max_workers:
+                        print(f"Listing pages {run_start}-{run_end} all failed, not probing further")
+                        probing = False
+                    continue
+                items, _ = result
+                if items:
+                    yield page, items
+                    continue
+                empty_pages.add(page)
+                run_start, run_end = _run(empty_pages, page)
+                if run_end - run_start + 1 >= stop_after_empty and (stop_at is None or run_start < stop_at):
+                    # 连续空页说明已经到底，不再调度后面的页面
+                    stop_at = run_start
+
+    # 到底之后的页面失败了也无妨
+    failed.update(page for page in given_up if stop_at is None or page < stop_at)
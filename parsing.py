@@ -0,0 +1,57 @@
+"""
+HTML parsing helpers shared by the spiders.
+
+``make_soup`` picks the fastest installed BeautifulSoup backend (lxml when
+available, otherwise the pure-Python ``html.parser``) and can restrict the tree
+to the part of the page a spider actually reads, e.g. ``scope='div.item'``.
+"""
+import os
+import re
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+
+def _default_parser():
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        return 'html.parser'
+    return 'lxml'
+
+
+# 可以通过环境变量 SPIDER_HTML_PARSER 指定解析器，例如 html.parser / lxml / html5lib
+PARSER = os.getenv('SPIDER_HTML_PARSER') or _default_parser()
+
+
+def set_parser(name):
+    """
+    Switches the backend used by ``make_soup`` for the whole process.
+    """
+    global PARSER
+    PARSER = name
+
+
+def _class_pattern(class_name):
+    # 解析时 class 属性还是原始字符串（如 "card gallery"），需要按单词匹配
+    return re.compile(r'(?:^|\s){}(?:\s|$)'.format(re.escape(class_name)))
+
+
+def strainer(selector):
+    """
+    Builds a SoupStrainer from a simple ``tag``, ``.class`` or ``tag.class`` selector.
+    """
+    tag, _, class_name = selector.partition('.')
+    kwargs = {'class_': _class_pattern(class_name)} if class_name else {}
+    return SoupStrainer(tag or None, **kwargs)
+
+
+def make_soup(markup, scope=None, parser=None):
+    """
+    Parses ``markup`` with the configured backend.
+
+    ``scope`` is a selector string or a SoupStrainer; when given, only the
+    matching elements and their children are built into the tree.
+    """
+    if isinstance(scope, str):
+        scope = strainer(scope)
+    return BeautifulSoup(markup, parser or PARSER, parse_only=scope)
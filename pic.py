@@ -1,27 +1,65 @@
 import os
-import random
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
-from bs4 import BeautifulSoup
 from tqdm import tqdm
 
+import downloader
+import http_client
+import image_store
+import pagination
+import parsing
+
+
+LIST_URL = 'https://com.okmzt.net/photo/page/{}'
+LIST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36',
+}
+
+
+def fetch_list_page(page):
+    """
+    Returns the album URLs on one listing page and the last page number it links to.
+
+    Returns None when the request failed, so the page isn't taken for the end of the list.
+    """
+    try:
+        res = http_client.get_session('pic').get(LIST_URL.format(page), headers=LIST_HEADERS)
+    except requests.RequestException as e:
+        print(f"Failed to fetch listing page {page}: {e}")
+        return None
+    if res.status_code == 404:
+        # 超出最后一页时站点返回 404
+        return [], None
+    if res.status_code != 200:
+        print(f"Failed to fetch listing page {page}: {res.status_code}")
+        return None
+    soup = parsing.make_soup(res.text, scope='.g-list')
+    g_list = soup.find(class_='g-list')
+    if g_list is None:
+        return [], None
 
-def fetch_all_page_urls():
     page_urls = []
-    for i in range(0, 10):
-        page_url = 'https://com.okmzt.net/photo/page/{}'.format(i)
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36',
-        }
-
-        res = requests.get(page_url, headers=headers)
-        soup = BeautifulSoup(res.text, 'html.parser')
-
-        lis = soup.find(class_='g-list').find_all('li')
-        for item in lis:
-            item_url = item.find('a').get('href')
-            page_urls.append(item_url)
+    for item in g_list.find_all('li'):
+        link = item.find('a')
+        if link is not None and link.get('href'):
+            page_urls.append(link.get('href'))
+    return page_urls, pagination.last_page_in_text(res.text, r'/photo/page/(\d+)')
+
+
+def iter_page_urls(max_workers=8, failed=None):
+    """
+    Yields album URLs while the listing pages are still being discovered.
+
+    Listing pages that kept failing are added to ``failed``.
+    """
+    pages = pagination.discover(fetch_list_page, first_page=1, max_workers=max_workers, failed=failed)
+    for _, page_urls in pages:
+        yield from page_urls
+
+
+def fetch_all_page_urls():
+    page_urls = list(iter_page_urls())
     print(page_urls, len(page_urls))
     return page_urls
 
@@ -30,12 +68,12 @@ def download_images(image_page_url):
     headers = {
         'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36',
     }
-    res = requests.get(image_page_url, headers=headers)
-    soup = BeautifulSoup(res.text, 'html.parser')
+    session = http_client.get_session('pic')
+    res = session.get(image_page_url, headers=headers)
+    soup = parsing.make_soup(res.text, scope='img')
 
-    # Set the directory to save images
-    img_dir = "img"
-    os.makedirs(img_dir, exist_ok=True)
+    # Images are stored by content hash under img/, indexed by URL
+    store = image_store.get_store("img")
 
     img_tags = soup.find_all('img', {'referrerpolicy': 'origin'})
     for img in img_tags:
@@ -44,38 +82,39 @@ def download_images(image_page_url):
 
         # 确保 img_url 不是 None
         if img_url is not None:
+            # 已经下载过的 URL 直接跳过，不再请求
+            if store.has(img_url):
+                return f"Skipped {img_url}"
             try:
-                img_data = requests.get(img_url, headers=headers).content
-
-                # 获取基础文件名和扩展名
-                base_name, ext = os.path.splitext(img_url.split('/')[-1])
+                # 大块流式写入 .part 文件，中断后下次用 Range 续传
+                tmp_path = downloader.download(session, img_url, store.download_path(img_url), headers=headers)
 
-                # 生成一个 6 位随机数
-                random_number = random.randint(100000, 999999)
+                # 按内容哈希保存图片，同一张图片只存一份
+                img_path = store.put_file(img_url, tmp_path)
 
-                # 构建目标文件名，格式为 'base_name_randomNumber.ext'
-                img_name = f"{base_name}_{random_number}{ext}"
-
-                # 保存图片
-                with open(os.path.join(img_dir, img_name), 'wb') as f:
-                    f.write(img_data)
-
-                return f"Downloaded {img_name}"
+                return f"Downloaded {os.path.basename(img_path)}"
             except Exception as e:
                 return f"Failed to download {img_url}: {str(e)}"
         else:
             return "Skipping image with no src attribute"
 
 
-if __name__ == '__main__':
-    urls = fetch_all_page_urls()
-
-    # Set up thread pool
-    max_threads = 4  # Adjust based on CPU and bandwidth
+def main(max_threads=16):
+    # Set up thread pool; max_threads is an upper bound, ratelimit adapts the real per-host concurrency
+    http_client.get_session('pic', pool_size=max_threads)
+    failed_pages = set()
     with ThreadPoolExecutor(max_workers=max_threads) as executor:
-        # Submit download tasks to the executor
-        futures = [executor.submit(download_images, url) for url in urls]
+        # 边发现列表页边提交下载任务，不用等所有列表页抓完
+        futures = [executor.submit(download_images, url) for url in iter_page_urls(failed=failed_pages)]
 
         # Use tqdm to show the progress
         for future in tqdm(as_completed(futures), total=len(futures), desc="Downloading images", unit="page"):
             future.result()  # This will raise any exceptions caught during download
+    if failed_pages:
+        print(f"Listing pages {sorted(failed_pages)} failed; their albums were not downloaded")
+        return False
+    return True
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,28 @@
+import argparse
 import os
+import threading
 import time
 from concurrent.futures import ThreadPoolExecutor
 
 import requests
-from bs4 import BeautifulSoup
 from tqdm import tqdm
 
+import checkpoint
+import downloader
+import http_client
+import image_store
+import pagination
+import parsing
+import pipeline
+
+# 图片按内容哈希保存在这里，专辑目录中的文件是指向它的硬链接
+STORE_DIR = os.path.join('img2', '.store')
+
+BASE_URL = 'https://www.girl-atlas.com/'
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36',
+}
+
 
 def get_response(url, headers=None, stream=False, retries=3, delay=2):
     """
@@ -13,7 +30,7 @@ def get_response(url, headers=None, stream=False, retries=3, delay=2):
     """
     for attempt in range(retries):
         try:
-            res = requests.get(url, headers=headers, stream=stream)
+            res = http_client.get_session('pic2').get(url, headers=headers, stream=stream)
             if res.status_code == 200:
                 return res
             else:
@@ -26,13 +43,13 @@ def get_response(url, headers=None, stream=False, retries=3, delay=2):
     return None
 
 
-def get_soup(url, headers):
+def get_soup(url, headers, scope=None):
     """
-    获取网页的 BeautifulSoup 对象
+    获取网页的 BeautifulSoup 对象，scope 指定时只解析对应的子树（如 '.card-columns'）
     """
     res = get_response(url, headers=headers)
     if res:
-        return BeautifulSoup(res.text, 'html.parser')
+        return parsing.make_soup(res.text, scope=scope)
     return None
 
 
@@ -61,24 +78,55 @@ def extract_album_urls_from_page(soup):
     return all_urls
 
 
-def fetch_all_page_urls():
+def fetch_list_page(page):
     """
-    获取所有页面中的专辑 URL
+    获取单个列表页中的专辑 URL，以及页面分页链接里的最大页码；请求失败时返回 None
     """
-    all_urls = []
-    base_url = 'https://www.girl-atlas.com/'
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36',
-    }
+    page_url = f'{BASE_URL}?p={page}'
+    res = get_response(page_url, headers=HEADERS)
+    if res is None:
+        return None
+    soup = parsing.make_soup(res.text, scope='.card-columns')
+    return extract_album_urls_from_page(soup), pagination.last_page_in_text(res.text, r'[?&]p=(\d+)')
 
-    for i in range(1, 2):  # 这里的 range 可以根据需要扩展
-        page_url = f'{base_url}?p={i}'
-        soup = get_soup(page_url, headers)
-        if soup:
-            urls_on_page = extract_album_urls_from_page(soup)
-            all_urls.extend(urls_on_page)
 
-    return all_urls
+def iter_page_urls(max_workers=8, state=None, failed=None):
+    """
+    边发现列表页边产出专辑 URL；最后一页从首页分页链接读取，读不到时逐批探测到空页为止
+
+    传入 state（checkpoint.Checkpoint）时记录每个列表页的专辑 URL，断点续爬时直接读取，不再请求已完成的列表页。
+    多次重试仍失败的列表页加入 failed，它们不记为完成，续爬时会重新请求
+    """
+    done_pages = {}
+    last_page = None
+    if state is not None:
+        done_pages = {int(page): urls for page, urls in state.done('page').items()}
+        last_page = state.output('meta', 'last_page')
+        for urls_on_page in done_pages.values():
+            yield from urls_on_page
+
+    def fetch_page(page):
+        result = fetch_list_page(page)
+        if result is None:
+            return None
+        urls_on_page, hint = result
+        if state is not None and urls_on_page:
+            if page == 1 and hint:
+                state.mark_done('meta', 'last_page', hint)
+            state.mark_done('page', page, urls_on_page)
+        return urls_on_page, hint
+
+    pages = pagination.discover(fetch_page, first_page=1, last_page=last_page, max_workers=max_workers,
+                                skip=done_pages, failed=failed)
+    for _, urls_on_page in pages:
+        yield from urls_on_page
+
+
+def fetch_all_page_urls():
+    """
+    获取所有页面中的专辑 URL
+    """
+    return list(iter_page_urls())
 
 
 def extract_filename_from_url(url):
@@ -90,23 +138,34 @@ def extract_filename_from_url(url):
 
 def download_image(url, folder_path):
     """
-    下载单张图片并保存到指定文件夹
+    下载单张图片并保存到指定文件夹，已下载过的 URL 不再请求
     """
-    response = get_response(url, stream=True)
-    if response:
-        filename = extract_filename_from_url(url)  # 使用提取文件名的函数
-        filepath = os.path.join(folder_path, filename)
-        with open(filepath, 'wb') as file:
-            for chunk in response.iter_content(1024):
-                file.write(chunk)
-        # print(f"Downloaded: {filepath}")
-    else:
-        print(f"Failed to download image from {url}")
-
-
-def process_album(base_url, url):
+    store = image_store.get_store(STORE_DIR)
+    filename = extract_filename_from_url(url)  # 使用提取文件名的函数
+    filepath = os.path.join(folder_path, filename)
+
+    stored = store.lookup(url)
+    if stored:
+        store.link(stored[2], filepath)
+        return filepath
+
+    try:
+        # 大块流式写入 .part 文件，中断后用 Range 续传，长度校验通过才算完成
+        tmp_path = downloader.download(http_client.get_session('pic2'), url, store.download_path(url))
+    except requests.RequestException as e:
+        print(f"Failed to download image from {url}: {e}")
+        return None
+    object_path = store.put_file(url, tmp_path)
+    store.link(object_path, filepath)
+    return filepath
+
+
+def process_album(base_url, url, download=download_image):
     """
-    处理单个专辑的图片下载
+    处理单个专辑：解析出所有图片 URL，交给 download(img_url, folder) 下载
+
+    页面获取成功时返回专辑文件夹路径（页面没有标题时为空字符串），即使其中没有可下载的图片；
+    页面获取失败时返回 None，下次续爬会重新处理
     """
     full_url = f'{base_url}{url}'
     headers = {
@@ -115,13 +174,14 @@ def process_album(base_url, url):
 
     res = get_response(full_url, headers=headers)
     if res:
-        soup = BeautifulSoup(res.text, 'html.parser')
+        # 标题和图库分布在页面不同位置，这里解析整页
+        soup = parsing.make_soup(res.text)
 
         # 提取专辑标题作为文件夹名
         header_title = soup.find('h1', class_='header-title')
         if header_title is None:
             print(f"Could not find element with class 'header-title' on {full_url}")
-            return
+            return ''
         folder_name = header_title.get_text(strip=True)
 
         # 创建专辑文件夹
@@ -132,13 +192,13 @@ def process_album(base_url, url):
         gallery = soup.find(class_='gallery')
         if gallery is None:
             print(f"Could not find element with class 'gallery' on {full_url}")
-            return
+            return album_folder_path
 
         # 查找所有的 'a' 标签
         a_tags = gallery.find_all('a')
         if not a_tags:
             print(f"No 'a' tags found within 'gallery' on {full_url}")
-            return
+            return album_folder_path
 
         for a_tag in a_tags:
             img_url = a_tag.get('data-src')
@@ -156,35 +216,108 @@ def process_album(base_url, url):
                     print(f"Unrecognized format for image URL: {img_url}")
                     continue  # 跳过不符合条件的 URL
 
-                download_image(full_img_url, album_folder_path)
+                download(full_img_url, album_folder_path)
+        return album_folder_path
 
     else:
         print(f"Failed to fetch {full_url}")
 
 
-def download_images_from_albums(urls):
+def download_images_from_albums(urls, album_workers=4, image_workers=16, state=None):
     """
     并发下载多个专辑中的图片
+
+    专辑解析和图片下载分开调度：专辑线程只负责解析图片 URL，
+    所有专辑的图片进入同一个有界下载池，大专辑不会独占一个线程。
+
+    传入 state（checkpoint.Checkpoint）时，专辑的所有图片都下载成功后才记为已完成，
+    断点续爬时跳过这些专辑；单张图片的完成情况由 image_store 的索引记录。
     """
-    base_url = 'https://www.girl-atlas.com/'
+    base_url = BASE_URL
 
     # 创建 img2 文件夹（如果不存在）
     if not os.path.exists('img2'):
         os.makedirs('img2')
 
-    # 使用多线程处理每个专辑
-    with ThreadPoolExecutor(max_workers=8) as executor:
-        list(tqdm(executor.map(lambda url: process_album(base_url, url), urls), total=len(urls)))
+    # 线程数只是上限，实际并发由 ratelimit 按 host 自适应调整
+    http_client.get_session('pic2', pool_size=album_workers + image_workers)
+
+    done_albums = state.done('album') if state is not None else {}
+    lock = threading.Lock()
+
+    with tqdm(desc="Downloading images", unit="img") as image_bar, \
+            pipeline.BoundedExecutor(image_workers, thread_name_prefix='image') as image_pool:
+
+        def on_image_done(future):
+            if future.exception() is not None:
+                print(f"Failed to download image: {future.exception()}")
+            image_bar.update(1)
+
+        def submit_image(img_url, folder_path):
+            future = image_pool.submit(download_image, img_url, folder_path)
+            future.add_done_callback(on_image_done)
+            return future
+
+        def submit_album(url):
+            # pending 包括专辑页解析本身和每张图片，全部成功结束时记录专辑完成
+            album = {'pending': 1, 'ok': True, 'images': 0, 'folder': None}
+
+            def finish(future):
+                ok = future.exception() is None and future.result() is not None
+                with lock:
+                    album['ok'] = album['ok'] and ok
+                    album['pending'] -= 1
+                    finished = album['pending'] == 0 and album['ok']
+                if finished and state is not None:
+                    state.mark_done('album', url, {'folder': album['folder'], 'images': album['images']})
+
+            def download(img_url, folder_path):
+                with lock:
+                    album['pending'] += 1
+                    album['images'] += 1
+                submit_image(img_url, folder_path).add_done_callback(finish)
+
+            def parse():
+                album['folder'] = process_album(base_url, url, download)
+                return album['folder']
+
+            future = album_pool.submit(parse)
+            future.add_done_callback(on_album_done)
+            future.add_done_callback(finish)
+
+        # urls 可以是生成器：专辑边被发现边提交，不必等所有列表页抓完
+        with ThreadPoolExecutor(max_workers=album_workers) as album_pool, \
+                tqdm(desc="Albums", unit="album") as album_bar:
+
+            def on_album_done(future):
+                if future.exception() is not None:
+                    print(f"Failed to process album: {future.exception()}")
+                album_bar.update(1)
+
+            for url in urls:
+                if url in done_albums:
+                    album_bar.update(1)
+                    continue
+                submit_album(url)
 
     # 顺序处理每个专辑
     # for url in tqdm(urls, total=len(urls)):  # 用 tqdm 包装循环以显示进度条
     #     process_album(base_url, url)
 
 
-if __name__ == '__main__':
-    # 获取所有专辑的 URL
-    album_urls = fetch_all_page_urls()
-    print(album_urls, len(album_urls))
+def main(album_workers=4, image_workers=16, resume=False):
+    # 列表页发现和专辑下载同时进行；完成情况记录在断点文件中，resume 时只处理未完成的部分
+    failed_pages = set()
+    with checkpoint.Checkpoint('pic2', resume=resume) as state:
+        download_images_from_albums(iter_page_urls(state=state, failed=failed_pages), album_workers,
+                                    image_workers, state)
+    if failed_pages:
+        print(f"列表页 {sorted(failed_pages)} 获取失败，其中的专辑未下载；使用 --resume 重新获取")
+        return False
+    return True
+
 
-    # 下载所有专辑中的图片
-    download_images_from_albums(album_urls)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="girl-atlas 专辑图片下载")
+    parser.add_argument('--resume', action='store_true', help='跳过上次已完成的列表页和专辑')
+    main(resume=parser.parse_args().resume)
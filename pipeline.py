@@ -0,0 +1,116 @@
+"""
+Streaming fetch -> parse -> insert pipeline.
+
+Producers push parsed rows into a bounded queue while a single writer thread
+inserts them in batches, so database time overlaps with fetching and memory
+stays flat no matter how large the crawl is.  ``BoundedExecutor`` is the
+matching building block for download stages fed by several producers.
+"""
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_DONE = object()
+
+
+class RowPipeline:
+    """
+    Bounded queue feeding ``write_batch(rows)`` on a background thread.
+
+    ``write_batch`` receives lists of at most ``batch_size`` rows and may
+    return the number of rows it stored.  ``maxsize`` bounds how many chunks
+    (e.g. pages) can be waiting; producers block when the writer falls behind.
+    """
+
+    def __init__(self, write_batch, batch_size=100, maxsize=50):
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize)
+        self.total = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self.thread.start()
+
+    def put(self, rows):
+        """
+        Queues one chunk of rows, blocking while the queue is full.
+        """
+        if rows:
+            self.queue.put(list(rows))
+
+    def _flush(self, buffer):
+        if self.error is not None:
+            return
+        try:
+            written = self.write_batch(buffer)
+            self.total += len(buffer) if written is None else written
+        except Exception as e:
+            # 记录错误但继续消费队列，避免生产者被阻塞
+            self.error = e
+
+    def _run(self):
+        buffer = []
+        while True:
+            rows = self.queue.get()
+            if rows is _DONE:
+                break
+            buffer.extend(rows)
+            while len(buffer) >= self.batch_size:
+                self._flush(buffer[:self.batch_size])
+                buffer = buffer[self.batch_size:]
+        if buffer:
+            self._flush(buffer)
+
+    def close(self):
+        """
+        Flushes the remaining rows, stops the writer and returns the row count.
+
+        Re-raises the first error raised by ``write_batch``.
+        """
+        self.queue.put(_DONE)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.total
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.queue.put(_DONE)
+            self.thread.join()
+
+
+class BoundedExecutor:
+    """
+    Thread pool whose ``submit`` blocks once ``max_pending`` tasks are waiting or running.
+
+    Lets fast producers (e.g. album pages) feed a shared worker pool without
+    queueing an unbounded number of tasks.
+    """
+
+    def __init__(self, max_workers, max_pending=None, thread_name_prefix=''):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.slots = threading.BoundedSemaphore(max_pending or max_workers * 4)
+
+    def submit(self, fn, *args, **kwargs):
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(wait=True)
@@ -0,0 +1,206 @@
+"""
+Per-host token-bucket rate limiter with adaptive (AIMD) concurrency.
+
+Every request to a host first takes a concurrency slot and a token from that
+host's bucket and reports its outcome afterwards.  Healthy responses raise the
+request rate and the concurrency limit additively; 429/403/503, slow responses
+and anti-bot pages cut both multiplicatively.  Spiders can therefore keep a
+generous thread pool and let the limiter find the rate the site tolerates.
+"""
+import asyncio
+import threading
+import time
+from urllib.parse import urlsplit
+
+# 这些状态码说明对方在限流或封禁
+THROTTLE_STATUS = {403, 429, 503}
+
+DEFAULTS = {
+    'rate': 2.0,  # 初始每秒请求数
+    'min_rate': 0.2,
+    'max_rate': 50.0,
+    'burst': 5,
+    'concurrency': 2,  # 初始并发数
+    'min_concurrency': 1,
+    'max_concurrency': 32,
+    'slow_after': 5.0,  # 超过该秒数（或 3 倍平均延迟）视为慢响应
+}
+
+# 两次减速之间至少间隔的秒数
+BACKOFF_COOLDOWN = 1.0
+
+
+class HostLimiter:
+    """
+    Token bucket plus AIMD concurrency window for a single host.
+    """
+
+    def __init__(self, rate, min_rate, max_rate, burst, concurrency, min_concurrency,
+                 max_concurrency, slow_after):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.limit = float(concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.slow_after = slow_after
+
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.paused_until = 0.0
+        self.last_backoff = 0.0
+        self.latency = None
+        self.slow_start = True
+        self.in_flight = 0
+        self.cond = threading.Condition()
+
+    def _reserve_token(self):
+        """
+        Takes one token and returns how long the caller must wait for it.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+    def _try_slot(self):
+        with self.cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return self._reserve_token()
+        return None
+
+    def acquire(self):
+        """
+        Blocks until a slot and a token are available.
+        """
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait()
+            self.in_flight += 1
+            wait = self._reserve_token()
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            except BaseException:
+                self.cancel()
+                raise
+
+    async def acquire_async(self):
+        """
+        Asyncio version of :meth:`acquire`; never blocks the event loop.
+        """
+        while True:
+            wait = self._try_slot()
+            if wait is not None:
+                break
+            await asyncio.sleep(0.05)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                # 等待期间被取消，归还已占用的并发名额
+                self.cancel()
+                raise
+
+    def cancel(self):
+        """
+        Frees a slot whose request was never sent, without adapting rate or concurrency.
+        """
+        with self.cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            self.cond.notify_all()
+
+    def release(self, status=None, elapsed=0.0, blocked=False, retry_after=None):
+        """
+        Frees the slot and adapts rate and concurrency to the outcome.
+
+        ``status`` is None for connection errors, which count as throttling.
+        """
+        with self.cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            slow = elapsed > max(self.slow_after, 3 * (self.latency or elapsed))
+            if status is not None and not slow:
+                self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+
+            if blocked or slow or status is None or status in THROTTLE_STATUS:
+                self._backoff(retry_after)
+            elif self.slow_start:
+                # 慢启动：首次被限流前，速率和并发数大约每个窗口翻倍
+                self.rate = min(self.max_rate, self.rate + self.rate / self.limit)
+                self.limit = min(self.max_concurrency, self.limit + 1)
+            else:
+                # 加性增长：速率每秒最多 +0.5，并发数每个窗口 +1
+                self.rate = min(self.max_rate, self.rate + 0.5 / max(self.rate, 1.0))
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+    def _backoff(self, retry_after):
+        now = time.monotonic()
+        if retry_after:
+            self.paused_until = max(self.paused_until, now + retry_after)
+        # 同一批失败只减速一次，避免把速率一下子压到最低
+        if now - self.last_backoff < max(BACKOFF_COOLDOWN, 2 * (self.latency or 0.0)):
+            return
+        self.last_backoff = now
+        self.slow_start = False
+        self.limit = max(self.min_concurrency, self.limit / 2)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = min(self.tokens, 0.0)
+
+
+_limiters = {}
+_overrides = {}
+_lock = threading.Lock()
+
+
+def host_of(url):
+    return urlsplit(url).hostname or ''
+
+
+def configure(host, **settings):
+    """
+    Overrides the starting settings (see ``DEFAULTS``) for ``host``.
+
+    Must be called before the first request to that host.
+    """
+    unknown = set(settings) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown rate limit settings: {', '.join(sorted(unknown))}")
+    with _lock:
+        _overrides.setdefault(host, {}).update(settings)
+
+
+def get_limiter(url):
+    """
+    Returns the shared limiter for the host of ``url``.
+    """
+    host = host_of(url)
+    with _lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = _limiters[host] = HostLimiter(**{**DEFAULTS, **_overrides.get(host, {})})
+        return limiter
+
+
+def parse_retry_after(headers):
+    value = headers.get('Retry-After') if headers else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def report_blocked(url):
+    """
+    Tells the limiter that a response for ``url`` was an anti-bot page.
+
+    Used by spiders that can only recognise blocking from the page content;
+    the request itself has already been released.
+    """
+    limiter = get_limiter(url)
+    with limiter.cond:
+        limiter._backoff(None)
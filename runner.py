@@ -0,0 +1,158 @@
+"""
+Run several spiders at once in one process.
+
+    python runner.py                       # 所有爬虫同时运行
+    python runner.py book movie jd         # 只运行指定的爬虫
+    python runner.py --budget pic2=8 pic2  # 调整单个爬虫的并发预算
+    python runner.py --list
+
+Every spider runs in its own thread but shares the process-wide pieces: one
+asyncio event loop and aiohttp pool for the async list crawls, the named HTTP
+sessions and per-host limiters, the GitHub quota scheduler and the MySQL
+connection pool.  A spider's budget is the worker count it is started with,
+so a nightly run takes about as long as its slowest spider.
+"""
+import argparse
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import async_fetch
+import http_client
+import storage
+
+# name -> (run(concurrency), default concurrency)
+SPIDERS = {}
+
+
+def register(name, concurrency):
+    """
+    Registers ``run(concurrency)`` as spider ``name`` with a default budget.
+
+    ``run`` returns True on success; a false result or an exception marks
+    the spider as failed.
+    """
+    def decorator(run):
+        SPIDERS[name] = (run, concurrency)
+        return run
+    return decorator
+
+
+# 各爬虫模块在运行时才导入，只跑部分爬虫时不加载其余依赖
+@register('book', concurrency=10)
+def run_book(concurrency):
+    import book
+    return book.main(concurrency=concurrency)
+
+
+@register('movie', concurrency=4)
+def run_movie(concurrency):
+    import movie
+    return movie.main(concurrency=concurrency)
+
+
+@register('github1', concurrency=10)
+def run_github1(concurrency):
+    import github1
+    return github1.main(thread_count=concurrency)
+
+
+@register('github2', concurrency=5)
+def run_github2(concurrency):
+    import github2
+    return github2.main(thread_count=concurrency)
+
+
+@register('jd', concurrency=8)
+def run_jd(concurrency):
+    import jd
+    return jd.run_all(thread_count=concurrency)
+
+
+@register('pic', concurrency=16)
+def run_pic(concurrency):
+    import pic
+    return pic.main(max_threads=concurrency)
+
+
+@register('pic2', concurrency=16)
+def run_pic2(concurrency):
+    import pic2
+    # 专辑解析线程只占预算的一小部分，其余用于图片下载
+    return pic2.main(album_workers=max(1, concurrency // 4), image_workers=concurrency)
+
+
+def _run_one(name, concurrency):
+    run, _ = SPIDERS[name]
+    start = time.monotonic()
+    try:
+        ok = bool(run(concurrency))
+    except Exception:
+        traceback.print_exc()
+        ok = False
+    return name, ok, time.monotonic() - start
+
+
+def run(names=None, budgets=None):
+    """
+    Runs the named spiders (all by default) concurrently; returns ``{name: (ok, seconds)}``.
+
+    ``budgets`` overrides the default concurrency per spider.
+    """
+    names = list(names or SPIDERS)
+    unknown = [name for name in names if name not in SPIDERS]
+    if unknown:
+        raise ValueError(f"Unknown spiders: {', '.join(unknown)}")
+    budgets = {name: (budgets or {}).get(name, SPIDERS[name][1]) for name in names}
+
+    # 连接在用到时才打开，这里只按同时运行的爬虫数定好上限：每个爬虫同一时间最多占用一两个连接（MySQL 连接池上限 32）
+    try:
+        storage.get_pool(size=min(32, 2 * len(names)))
+    except storage.DB_ERRORS as e:
+        print(f'Failed to create the database pool: {e}')
+    async_fetch.start_shared_loop()
+    try:
+        with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix='spider') as executor:
+            futures = [executor.submit(_run_one, name, budgets[name]) for name in names]
+            results = {}
+            for future in futures:
+                name, ok, seconds = future.result()
+                results[name] = (ok, seconds)
+    finally:
+        async_fetch.stop_shared_loop()
+        http_client.close_all()
+
+    for name, (ok, seconds) in results.items():
+        print(f"{name:<8} {'ok' if ok else 'FAILED':<6} {seconds:7.1f}s  (concurrency {budgets[name]})")
+    return results
+
+
+def _parse_budget(value):
+    name, _, number = value.partition('=')
+    if not number.isdigit() or int(number) < 1:
+        raise argparse.ArgumentTypeError(f"expected NAME=N, got {value!r}")
+    return name, int(number)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="同时运行多个爬虫")
+    parser.add_argument('spiders', nargs='*', help=f"要运行的爬虫，默认全部：{', '.join(SPIDERS)}")
+    parser.add_argument('--budget', action='append', type=_parse_budget, default=[], metavar='NAME=N',
+                        help='单个爬虫的并发预算，可重复指定')
+    parser.add_argument('--list', action='store_true', help='列出已注册的爬虫')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, (_, concurrency) in SPIDERS.items():
+            print(f"{name:<8} concurrency {concurrency}")
+        return 0
+    try:
+        results = run(args.spiders, dict(args.budget))
+    except ValueError as e:
+        parser.error(str(e))
+    return 0 if all(ok for ok, _ in results.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
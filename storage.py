@@ -0,0 +1,381 @@
+"""
+Shared MySQL storage layer for all spiders.
+
+Connections come from one pool per database config and are opened as they
+are needed.  ``BulkLoader`` buffers rows and writes them with large multi-row
+INSERTs (or a single ``LOAD DATA LOCAL INFILE``) and commits once per load
+instead of once per batch.  ``StagingLoad`` fills a shadow table and swaps it in with one
+``RENAME TABLE``, so readers never see a half-loaded table.  Any DB-API
+connection works, so loads can be exercised against a local ``sqlite3``
+database as well.
+"""
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+
+import mysql.connector
+from mysql.connector import pooling
+
+db_config = {
+    'host': '106.15.79.229',
+    'port': 3306,
+    'user': 'root',
+    'password': '910920',
+    'database': 'demo',
+    'connect_timeout': 30,
+    'allow_local_infile': True,
+}
+
+DB_ERRORS = (mysql.connector.Error, sqlite3.Error)
+
+# 每条 INSERT 语句最多包含的行数
+BATCH_ROWS = 1000
+
+_pools = {}
+_lock = threading.Lock()
+
+
+class LazyPool:
+    """
+    MySQL connection pool that opens connections on first demand, up to ``size``.
+
+    ``MySQLConnectionPool`` connects all of its slots up front; here a spider
+    that only ever holds one connection opens one.  When all ``size``
+    connections are in use ``get_connection()`` raises ``PoolError`` right
+    away instead of waiting for one to be returned.
+    """
+
+    def __init__(self, name, size, config):
+        self.pool = pooling.MySQLConnectionPool(pool_name=name, pool_size=size)
+        self.pool.set_config(**config)
+        self.size = size
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def get_connection(self):
+        with self.lock:
+            try:
+                return self.pool.get_connection()
+            except pooling.PoolError:
+                if self.opened >= self.size:
+                    raise
+            # 空闲连接用完且未达上限时再新开一个
+            self.pool.add_connection()
+            self.opened += 1
+            return self.pool.get_connection()
+
+
+def get_pool(config=None, size=10):
+    """
+    Returns the shared connection pool for ``config`` (defaults to ``db_config``).
+
+    ``size`` only caps the pool; connections are opened as they are needed.
+    The first call fixes the size.
+    """
+    config = config or db_config
+    key = (config['host'], config.get('port'), config['user'], config.get('database'))
+    with _lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = LazyPool(f"spider_{len(_pools)}", size, config)
+        return pool
+
+
+def connect(config=None):
+    """
+    Takes a connection from the pool; ``close()`` hands it back.
+
+    Raises ``PoolError`` (a ``mysql.connector.Error``) when the pool is exhausted.
+    """
+    return get_pool(config).get_connection()
+
+
+def _tsv_field(value):
+    # LOAD DATA 默认的转义规则：\N 表示 NULL，反斜杠、制表符和换行需要转义
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def placeholder(conn):
+    return '?' if isinstance(conn, sqlite3.Connection) else '%s'
+
+
+def insert_sql(conn, table, columns, rows=1):
+    """
+    Builds ``INSERT INTO table (columns) VALUES (...), (...)`` for ``rows`` rows.
+    """
+    mark = placeholder(conn)
+    values = '(' + ', '.join([mark] * len(columns)) + ')'
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ', '.join([values] * rows)
+
+
+class BulkLoader:
+    """
+    Buffers rows for ``table`` and writes them in large batches.
+
+    Nothing is committed until :meth:`commit`, so a load is all-or-nothing.
+    With ``use_infile`` the rows are spooled to a temporary file and loaded
+    with one ``LOAD DATA LOCAL INFILE`` (MySQL only).  Used as a context
+    manager it commits on success and rolls back on error.
+    """
+
+    def __init__(self, conn, table, columns, batch_rows=BATCH_ROWS, use_infile=False):
+        self.conn = conn
+        self.table = table
+        self.columns = list(columns)
+        self.batch_rows = batch_rows
+        self.use_infile = use_infile and not isinstance(conn, sqlite3.Connection)
+        self.buffer = []
+        self.total = 0
+        self.spool = None
+        self.lock = threading.Lock()
+
+    def add(self, rows):
+        """
+        Queues rows for insertion; returns how many were accepted.
+        """
+        rows = list(rows)
+        with self.lock:
+            if self.use_infile:
+                self._spool(rows)
+            else:
+                self.buffer.extend(rows)
+                while len(self.buffer) >= self.batch_rows:
+                    self._insert(self.buffer[:self.batch_rows])
+                    self.buffer = self.buffer[self.batch_rows:]
+        return len(rows)
+
+    def _insert(self, batch):
+        cursor = self.conn.cursor()
+        try:
+            params = [value for row in batch for value in row]
+            cursor.execute(insert_sql(self.conn, self.table, self.columns, len(batch)), params)
+            self.total += len(batch)
+        except DB_ERRORS as e:
+            # 整批失败时逐条插入，跳过有问题的记录
+            print(f'Batch insert into {self.table} failed, retrying row by row: {e}')
+            sql = insert_sql(self.conn, self.table, self.columns)
+            for row in batch:
+                try:
+                    cursor.execute(sql, row)
+                    self.total += 1
+                except DB_ERRORS as row_error:
+                    print(f'Single record insert error: {row_error}')
+        finally:
+            cursor.close()
+
+    def _spool(self, rows):
+        if self.spool is None:
+            self.spool = tempfile.NamedTemporaryFile(
+                'w', suffix='.tsv', encoding='utf-8', newline='', delete=False)
+        self.spool.writelines('\t'.join(map(_tsv_field, row)) + '\n' for row in rows)
+        self.total += len(rows)
+
+    def _load_spool(self):
+        self.spool.close()
+        path = self.spool.name.replace('\\', '/')
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(
+                f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {self.table} CHARACTER SET utf8mb4 "
+                "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+                f"({', '.join(self.columns)})")
+        finally:
+            cursor.close()
+            os.remove(self.spool.name)
+            self.spool = None
+
+    def flush(self):
+        """
+        Writes everything buffered so far without committing.
+        """
+        with self.lock:
+            if self.buffer:
+                self._insert(self.buffer)
+                self.buffer = []
+            if self.spool is not None:
+                self._load_spool()
+
+    def commit(self):
+        """
+        Flushes and commits the whole load; returns the number of rows written.
+        """
+        self.flush()
+        self.conn.commit()
+        return self.total
+
+    def rollback(self):
+        with self.lock:
+            self.buffer = []
+            if self.spool is not None:
+                self.spool.close()
+                os.remove(self.spool.name)
+                self.spool = None
+            self.total = 0
+        self.conn.rollback()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+
+class StagingLoad(BulkLoader):
+    """
+    Loads into ``<table>__staging`` and atomically swaps it with ``table``.
+
+    Use as a context manager.  The swap only happens when the block finishes
+    without error, :meth:`abort` wasn't called and at least ``min_rows`` rows
+    were loaded; otherwise the staging table is dropped and the live table
+    keeps its old data.  ``swapped`` tells which of the two happened.
+
+    For resumable loads, ``keep_on_error`` leaves the staging table (with
+    everything committed so far) in place when the block fails or the load
+    is aborted, and
+    ``resume`` continues filling a staging table left by an earlier run
+    instead of recreating it; ``resumed`` tells whether one was found.
+    """
+
+    def __init__(self, conn, table, columns, min_rows=1, resume=False, keep_on_error=False, **kwargs):
+        super().__init__(conn, f"{table}__staging", columns, **kwargs)
+        self.live_table = table
+        self.old_table = f"{table}__old"
+        self.min_rows = min_rows
+        self.resume = resume
+        self.keep_on_error = keep_on_error
+        self.resumed = False
+        self.swapped = False
+        self.aborted = None
+
+    def abort(self, reason):
+        """
+        Keeps the live table even if the block finishes, e.g. because some pages failed.
+        """
+        self.aborted = reason
+
+    def _execute(self, *statements):
+        cursor = self.conn.cursor()
+        try:
+            for sql in statements:
+                cursor.execute(sql)
+        finally:
+            cursor.close()
+
+    def _staging_rows(self):
+        # 影子表不存在时返回 None
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"SELECT COUNT(*) FROM {self.table}")
+            return cursor.fetchone()[0]
+        except DB_ERRORS:
+            return None
+        finally:
+            cursor.close()
+
+    def _create_staging(self):
+        if self.resume:
+            rows = self._staging_rows()
+            if rows is not None:
+                # 接着上次中断时已提交的数据继续写入
+                self.total = rows
+                self.resumed = True
+                return
+        self._execute(f"DROP TABLE IF EXISTS {self.table}")
+        if isinstance(self.conn, sqlite3.Connection):
+            # SQLite 没有 CREATE TABLE ... LIKE，复制原表的建表语句
+            cursor = self.conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (self.live_table,))
+            create_sql = re.sub(r'^CREATE TABLE\s+(?:"[^"]+"|`[^`]+`|\[[^\]]+\]|\w+)',
+                                f'CREATE TABLE {self.table}', cursor.fetchone()[0], count=1, flags=re.I)
+            self._execute(create_sql)
+        else:
+            self._execute(f"CREATE TABLE {self.table} LIKE {self.live_table}")
+
+    def _swap(self):
+        if isinstance(self.conn, sqlite3.Connection):
+            # SQLite 的 DDL 可以放进事务，三步要么全部生效要么都不生效
+            self.conn.execute("BEGIN")
+            self._execute(f"ALTER TABLE {self.live_table} RENAME TO {self.old_table}",
+                          f"ALTER TABLE {self.table} RENAME TO {self.live_table}")
+            self.conn.commit()
+        else:
+            self._execute(f"DROP TABLE IF EXISTS {self.old_table}",
+                          f"RENAME TABLE {self.live_table} TO {self.old_table}, "
+                          f"{self.table} TO {self.live_table}")
+        self._execute(f"DROP TABLE {self.old_table}")
+        self.swapped = True
+
+    def __enter__(self):
+        self._create_staging()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.commit()
+                if self.aborted:
+                    print(f'{self.aborted}, keeping the current {self.live_table} table')
+                elif self.total >= self.min_rows:
+                    self._swap()
+                else:
+                    print(f'Only {self.total} rows loaded, keeping the current {self.live_table} table')
+            else:
+                self.rollback()
+        finally:
+            failed = exc_type is not None or self.aborted
+            if not self.swapped and (not failed or not self.keep_on_error):
+                self._execute(f"DROP TABLE IF EXISTS {self.table}")
+
+
+class Database:
+    """
+    Base class for the spiders' Database helpers, backed by the shared pool.
+
+    Pass ``conn`` (e.g. a ``sqlite3`` connection) to use a local stand-in
+    instead of the pool.
+    """
+
+    def __init__(self, config=None, conn=None):
+        self.config = config
+        self.conn = conn
+
+    def connect(self):
+        if self.conn is not None:
+            return
+        try:
+            self.conn = connect(self.config)
+        except mysql.connector.Error as e:
+            print(f'Failed to connect to the database: {e}')
+
+    def staging_load(self, table, columns, **kwargs):
+        """
+        Loader that replaces the contents of ``table`` atomically on success.
+        """
+        return StagingLoad(self.conn, table, columns, **kwargs)
+
+    def replace_rows(self, table, columns, rows, **kwargs):
+        """
+        Replaces the contents of ``table`` with ``rows``; returns the row count.
+
+        The old rows stay visible until the new ones are fully loaded.
+        """
+        try:
+            with self.staging_load(table, columns, **kwargs) as loader:
+                loader.add(rows)
+        except DB_ERRORS as e:
+            print(f'Failed to load data into {table}: {e}')
+            return 0
+        return loader.total if loader.swapped else 0
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
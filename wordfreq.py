@@ -0,0 +1,178 @@
+"""
+Parallel, cached Chinese word counting for word clouds.
+
+Comments are tokenized with jieba in worker processes that share one
+preloaded dictionary (loaded in the parent before forking, or once per
+worker from the prebuilt cache where fork isn't safe).  Stop words are
+dropped before counting, and the per-comment counts are cached in SQLite by
+comment id, so later runs only tokenize comments that weren't seen before.
+"""
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+from collections import Counter
+
+import jieba
+
+CACHE_PATH = os.getenv('SPIDER_TOKEN_CACHE', '.token_cache.sqlite')
+# jieba 词典的预构建缓存；默认放在系统临时目录，容器重启后就没了，每次都要重新构建
+JIEBA_CACHE = os.getenv('SPIDER_JIEBA_CACHE', os.path.join('.cache', 'jieba.cache'))
+
+# 少于这么多条未缓存的评论时直接在当前进程分词，省去启动进程池的开销
+PARALLEL_MIN = 2000
+BATCH_SIZE = 500
+LOOKUP_CHUNK = 500
+
+STOP_WORDS = frozenset("""
+的 了 是 我 也 很 都 就 和 在 有 还 不 没 这 那 个 吧 啊 呢 吗 哦 嗯 呀 着 给 用 把 被 让 与 及 或 而 又 但
+一个 我们 你们 他们 自己 什么 这个 那个 非常 比较 还是 就是 然后 因为 所以 但是 而且 已经 可以 感觉 觉得
+没有 不是 这样 一下 一些 东西 时候 真的 之前 之后 一直 其他 不错 hellip quot amp nbsp
+""".split())
+
+_stop_words = STOP_WORDS
+
+
+def _is_word(word, stop_words):
+    word = word.strip()
+    # 单字和纯符号基本不含信息，和停用词一起在计数前去掉
+    return len(word) > 1 and word not in stop_words and any(ch.isalnum() for ch in word)
+
+
+def load_dictionary(cache_file=JIEBA_CACHE):
+    """
+    Loads jieba's dictionary from the prebuilt cache, building the cache on first use.
+    """
+    if jieba.dt.initialized:
+        return
+    cache_file = os.path.abspath(cache_file)
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    jieba.dt.cache_file = cache_file
+    jieba.initialize()
+
+
+def tokenize(text, stop_words=STOP_WORDS):
+    """
+    Word counts for one text, without stop words.
+    """
+    return Counter(word for word in jieba.cut(text or '') if _is_word(word, stop_words))
+
+
+def _init_worker(stop_words):
+    global _stop_words
+    _stop_words = stop_words
+    # fork 出来的进程已经继承了词典，这里是 no-op；spawn 时每个进程从缓存加载一次
+    load_dictionary()
+
+
+def _tokenize_batch(batch, stop_words=None):
+    stop_words = _stop_words if stop_words is None else stop_words
+    return [(comment_id, tokenize(text, stop_words)) for comment_id, text in batch]
+
+
+def _batches(items, size):
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+class TokenCache:
+    """
+    comment id -> word counts, stored as JSON in a SQLite file.
+
+    The cache remembers which stop words it was built with and starts over
+    when they change.
+    """
+
+    def __init__(self, path=CACHE_PATH, stop_words=STOP_WORDS):
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS tokens (comment_id TEXT PRIMARY KEY, counts TEXT NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        fingerprint = hashlib.sha1('\n'.join(sorted(stop_words)).encode('utf-8')).hexdigest()
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'stop_words'").fetchone()
+        if row is None or row[0] != fingerprint:
+            self.db.execute("DELETE FROM tokens")
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('stop_words', ?)", (fingerprint,))
+        self.db.commit()
+
+    def lookup(self, comment_ids):
+        """
+        Returns ``{comment_id: Counter}`` for the ids that are cached.
+        """
+        found = {}
+        for chunk in _batches(comment_ids, LOOKUP_CHUNK):
+            placeholders = ', '.join('?' * len(chunk))
+            rows = self.db.execute(
+                f"SELECT comment_id, counts FROM tokens WHERE comment_id IN ({placeholders})", chunk)
+            for comment_id, counts in rows:
+                found[comment_id] = Counter(json.loads(counts))
+        return found
+
+    def store(self, results):
+        self.db.executemany("INSERT OR REPLACE INTO tokens (comment_id, counts) VALUES (?, ?)",
+                            [(comment_id, json.dumps(counts, ensure_ascii=False))
+                             for comment_id, counts in results])
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+def _pool(processes, stop_words):
+    # 只有单线程进程才能安全地 fork；在 runner 里其他爬虫线程可能正持有锁（sqlite、urllib3、tqdm），
+    # fork 出的子进程会带着这些锁死锁，这时改用 spawn，每个进程从缓存加载词典
+    single_threaded = threading.active_count() == 1
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if single_threaded and 'fork' in methods else 'spawn')
+    return context.Pool(processes, initializer=_init_worker, initargs=(stop_words,))
+
+
+def word_counts(comments, cache_path=CACHE_PATH, processes=None, stop_words=STOP_WORDS):
+    """
+    Total word counts over ``comments``, an iterable of ``(comment_id, text)``.
+
+    Comments without an id are tokenized every time; all others are looked up
+    in the cache first and stored there after tokenizing.
+    """
+    total = Counter()
+    cache = TokenCache(cache_path, stop_words) if cache_path else None
+    pending = []
+    try:
+        for chunk in _batches(comments, LOOKUP_CHUNK):
+            ids = [str(comment_id) for comment_id, _ in chunk if comment_id is not None]
+            cached = cache.lookup(ids) if cache is not None else {}
+            for comment_id, text in chunk:
+                key = None if comment_id is None else str(comment_id)
+                if key in cached:
+                    total.update(cached[key])
+                elif text:
+                    pending.append((key, text))
+
+        if not pending:
+            return total
+        # 先在父进程加载词典，fork 出来的子进程直接共享
+        load_dictionary()
+        if len(pending) < PARALLEL_MIN:
+            results = (_tokenize_batch(batch, stop_words) for batch in _batches(pending, BATCH_SIZE))
+            _collect(results, total, cache)
+        else:
+            with _pool(processes, stop_words) as pool:
+                _collect(pool.imap_unordered(_tokenize_batch, _batches(pending, BATCH_SIZE)), total, cache)
+    finally:
+        if cache is not None:
+            cache.close()
+    return total
+
+
+def _collect(results, total, cache):
+    for batch in results:
+        for _, counts in batch:
+            total.update(counts)
+        if cache is not None:
+            cache.store([(key, counts) for key, counts in batch if key is not None])